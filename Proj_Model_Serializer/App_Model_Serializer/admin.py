@@ -1,15 +1,130 @@
+from types import SimpleNamespace
+
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
 
+from .cache import ResponseCache
 from .models import *
 
+# Changelist counts and filter facet counts, time bounded only, writes do not invalidate them
+count_cache = ResponseCache(timeout=60, max_entries=1000)
+
+
+def get_query_key(queryset, *parts):
+    """None for querysets that can not match anything (pk__in=[] etc.)"""
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return None
+    return count_cache.make_key((queryset.db, sql, params) + parts)
+
+
+def estimate_count(queryset):
+    """Row estimate of the planner statistics for an unfiltered queryset, None when there is none"""
+    if queryset.query.where or queryset.query.distinct:
+        return None
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)', [table])
+            elif connection.vendor == 'sqlite':
+                # Filled by ANALYZE, the first number of each stat is the row count of the table/index
+                cursor.execute("SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s", [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+def get_cached_count(queryset, count_threshold, count_timeout):
+    """
+    Read from count_cache, otherwise the planner estimate for unfiltered tables of at least
+    count_threshold rows, otherwise a COUNT(*), cached for count_timeout seconds
+    """
+    key = get_query_key(queryset, 'count')
+    if key is None:
+        return 0
+    cached = count_cache.get(key)
+    if cached is None:
+        count = estimate_count(queryset)
+        if count is None or count < count_threshold:
+            count = queryset.count()
+        cached = count_cache.set(key, {'count': count}, count_timeout)
+    return cached['count']
+
+
+class CachedCountPaginator(Paginator):
+
+    def __init__(self, *args, count_threshold=100000, count_timeout=60, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_threshold = count_threshold
+        self.count_timeout = count_timeout
+
+    @cached_property
+    def count(self):
+        return get_cached_count(self.object_list, self.count_threshold, self.count_timeout)
+
+
+class CachedFacetsMixin:
+    """Facet counts of a list filter cached for the facet_count_timeout of its model admin"""
+
+    def get_facet_queryset(self, changelist):
+        filtered_qs = changelist.get_queryset(self.request, exclude_parameters=self.expected_parameters())
+        key = get_query_key(filtered_qs, 'facets', self.__class__.__qualname__, getattr(self, 'field_path', None))
+        cached = count_cache.get(key) if key is not None else None
+        if cached is None:
+            cached = filtered_qs.aggregate(**self.get_facet_counts(changelist.pk_attname, filtered_qs))
+            if key is not None:
+                count_cache.set(key, cached, getattr(changelist.model_admin, 'facet_count_timeout', None))
+        return cached
+
+
+class CachedBooleanFieldListFilter(CachedFacetsMixin, admin.BooleanFieldListFilter):
+    pass
+
+
+class CachedRelatedFieldListFilter(CachedFacetsMixin, admin.RelatedFieldListFilter):
+    pass
+
+
+class MyChangeList(ChangeList):
+
+    def get_results(self, request):
+        # The unfiltered total of show_full_result_count is cached as well,
+        # ChangeList only calls count() on root_queryset here
+        root_queryset = self.root_queryset
+        self.root_queryset = SimpleNamespace(count=lambda: get_cached_count(
+            root_queryset, self.model_admin.count_threshold, self.model_admin.count_timeout))
+        try:
+            super().get_results(request)
+        finally:
+            self.root_queryset = root_queryset
+
 
 # Register your models here.
 class MyAdmin(admin.ModelAdmin):
+    """
+    Changelists of soft deleted rows included.
+    FKs of list_display are select_related, counts come from CachedCountPaginator and
+    the is_del facet counts are cached, so large tables do not COUNT(*) on every page load.
+    """
+    paginator = CachedCountPaginator
+    count_threshold = 100000
+    count_timeout = 60
+    facet_count_timeout = 60
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.list_display = ('id',) + self.list_display + ('is_del',)
-        self.list_filter = self.list_filter + ('is_del',)
+        self.list_filter = self.list_filter + (('is_del', CachedBooleanFieldListFilter),)
 
     def get_queryset(self, request):
         qs = self.model.all_objects.get_queryset()
@@ -18,6 +133,28 @@ class MyAdmin(admin.ModelAdmin):
             qs = qs.order_by(*ordering)
         return qs
 
+    def get_list_select_related(self, request):
+        if self.list_select_related is not False:
+            return self.list_select_related
+        related = []
+        for name in self.get_list_display(request):
+            if not isinstance(name, str):
+                continue
+            try:
+                field = self.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.many_to_one or (field.one_to_one and field.concrete):
+                related.append(name)
+        return related or False
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return self.paginator(queryset, per_page, orphans, allow_empty_first_page,
+                              count_threshold=self.count_threshold, count_timeout=self.count_timeout)
+
+    def get_changelist(self, request, **kwargs):
+        return MyChangeList
+
 
 @admin.register(Employee)
 class EmployeeAdmin(MyAdmin):
@@ -27,10 +164,3 @@ class EmployeeAdmin(MyAdmin):
 @admin.register(Department)
 class DepartmentAdmin(MyAdmin):
     list_display = ('name',)
-
-
-
-
-
-
-
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AppModelSerializerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'App_Model_Serializer'
+
+    def ready(self):
+        from . import metrics  # noqa: F401, installs the query recorder on new database connections
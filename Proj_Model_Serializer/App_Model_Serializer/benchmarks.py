@@ -0,0 +1,370 @@
+import asyncio
+import inspect
+import itertools
+import logging
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test import AsyncClient
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework.relations import PrimaryKeyRelatedField, ManyRelatedField
+from rest_framework.serializers import ModelSerializer
+
+from .cache import response_cache
+from .form_configs import build_form_configs
+from .models import Employee, Department
+from .query_plan import get_values_plan, iter_values_representation
+from .rec_id import rec_id_codec
+from .renderers import CRUDJSONRenderer
+from .serializer import EmployeeListRetrieveSerializer, EmployeeCreateUpdateSerializer, \
+    DepartmentListRetrieveSerializer, DjangoSerializerValidator
+
+
+class LegacyRepresentationMixin:
+    """Per row get_fields() + isinstance representation, kept as the 'before' of the benchmarks"""
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['rec_id'] = str(instance.id + 10000)
+        data['salt'] = instance.salt
+        for k, v in self.get_fields().items():
+            if isinstance(v, PrimaryKeyRelatedField):
+                inst = getattr(instance, k, None)
+                if inst:
+                    data[k] = {'value': str(inst.id + 10000),
+                               'salt': inst.salt,
+                               'label': str(inst)}
+            if isinstance(v, ManyRelatedField):
+                qs = getattr(instance, k, None)
+                data[k] = [{'value': str(inst.id + 10000),
+                            'salt': inst.salt,
+                            'label': str(inst)} for inst in qs.all()]
+        return data
+
+
+class LegacyEmployeeListRetrieveSerializer(LegacyRepresentationMixin, ModelSerializer):
+    class Meta:
+        model = Employee
+        fields = ['name', 'department']
+
+
+class LegacyDepartmentListRetrieveSerializer(LegacyRepresentationMixin, ModelSerializer):
+    employees = LegacyEmployeeListRetrieveSerializer(many=True)
+
+    class Meta:
+        model = Department
+        fields = ['name', 'employees']
+
+
+class LegacyDjangoSerializerValidator(DjangoSerializerValidator):
+    """inspect.stack() + per call verbose name add_error, kept as the 'before' of the benchmarks"""
+    error_msg = {
+        'check_empty': '{field} is required',
+        'check_exists': '{field} is already exists',
+    }
+
+    def get_verbose_name(self, name):
+        return self.model._meta.get_field(name).verbose_name.capitalize()
+
+    def add_error(self, field, check=None):
+        func_name = inspect.stack()[1].frame.f_code.co_name
+        error_msg = self.error_msg[func_name].format(field=self.get_verbose_name(field))
+        if field not in self.custom_errors:
+            self.custom_errors[field] = [error_msg]
+        else:
+            self.custom_errors[field].append(error_msg)
+
+
+def seed_data(rows, employees_per_department=50, deleted_every=0):
+    """deleted_every=n soft deletes every n-th employee"""
+    departments = Department.objects.bulk_create(
+        Department(name=f'Department {i}', salt=f'dept-salt-{i}')
+        for i in range(max(1, rows // employees_per_department)))
+    Employee.objects.bulk_create(
+        (Employee(name=f'Employee {i}', salt=f'emp-salt-{i}', department=departments[i % len(departments)],
+                  is_del=bool(deleted_every) and i % deleted_every == 0)
+         for i in range(rows)), batch_size=1000)
+
+
+def best_ms(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return round(min(timings) * 1000, 3)
+
+
+def rows_per_second(func, rows, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return round(rows / min(timings), 1)
+
+
+def percentile(timings, percent):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * percent / 100))]
+
+
+def measure_requests(send, requests):
+    """
+    Latency percentiles/throughput of requests calls of send(i), response cache cleared before each,
+    queries of the last call and peak traced memory of one extra call
+    """
+    counter = itertools.count()
+    timings = []
+    for _ in range(requests):
+        response_cache.clear()
+        start = time.perf_counter()
+        send(next(counter))
+        timings.append(time.perf_counter() - start)
+    response_cache.clear()
+    # CaptureQueriesContext does not survive request_started resetting connection.queries_log
+    queries = []
+    with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+        send(next(counter))
+    response_cache.clear()
+    tracemalloc.start()
+    try:
+        send(next(counter))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'requests': requests,
+        'requests_per_sec': round(requests / sum(timings), 1),
+        **{f'p{p}_ms': round(percentile(timings, p) * 1000, 3) for p in (50, 90, 99)},
+        'queries': len(queries),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def get_view_scenarios(client, url_name, children):
+    """{scenario: send(i)} of a CRUD view, every send asserts the status code it expects"""
+    url = reverse(url_name)
+    department = Department.objects.order_by('pk').first()
+    department_rec_id = rec_id_codec.encode(department.pk)
+    model = Employee if url_name == 'employee' else Department
+    rec_id = rec_id_codec.encode(model.objects.order_by('pk').values_list('pk', flat=True).first())
+    # Taken from the last row, update renames the first one
+    existing_name = model.objects.order_by('pk').values_list('name', flat=True).last()
+
+    def payload(name):
+        return {'name': name, 'department': department_rec_id} if model is Employee else {'name': name}
+
+    def send(method, expected_status, *args, **kwargs):
+        response = getattr(client, method)(*args, **kwargs)
+        assert response.status_code == expected_status, (url_name, response.status_code, response.content[:200])
+
+    scenarios = {
+        'get_data': lambda i: send('get', 200, url, {'action': 'get_data'}),
+        'get_data_sparse': lambda i: send('get', 200, url, {'action': 'get_data', 'fields': 'name'}),
+        'fetch_record': lambda i: send('get', 200, url, {'action': 'fetch_record', 'rec_id': rec_id}),
+        'update': lambda i: send('put', 200, f'{url}?rec_id={rec_id}', payload(f'Updated {url_name} {i}'),
+                                 format='json'),
+        'validation_errors': lambda i: send('post', 400, url, {**payload(existing_name), 'department': ''}
+                                            if model is Employee else payload(existing_name), format='json'),
+    }
+    if model is Department:
+        scenarios['create'] = lambda i: send('post', 201, url, {**payload(f'Created {url_name} {i}'), 'employees': []},
+                                             format='json')
+        scenarios['repeater'] = lambda i: send(
+            'post', 201, url, {'name': f'Repeater {i}', 'employees': [{'name': f'Child {i}.{j}'}
+                                                                       for j in range(children)]}, format='json')
+        scenarios['repeater_validation_errors'] = lambda i: send(
+            'post', 400, url, {'name': f'Invalid repeater {i}', 'employees': [{'name': ''} for _ in range(children)]},
+            format='json')
+    else:
+        scenarios['create'] = lambda i: send('post', 201, url, payload(f'Created {url_name} {i}'), format='json')
+    return scenarios
+
+
+def bench_views(rows, repeat, requests=20, children=50):
+    """
+    Every scenario of EmployeeView and DepartmentView through the full request stack, on rows employees
+    (a tenth soft deleted) in departments of 50. repeat passes per scenario, the best pass is kept.
+    """
+    seed_data(rows, deleted_every=10)
+    client = APIClient()
+    results = []
+    # 'Bad Request' warnings of the validation error scenarios
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    for url_name, view in (('employee', 'EmployeeView'), ('department', 'DepartmentView')):
+        for scenario, send in get_view_scenarios(client, url_name, children).items():
+            runs = [measure_requests(send, requests) for _ in range(repeat)]
+            best = max(runs, key=lambda run: run['requests_per_sec'])
+            results.append({'view': view, 'scenario': scenario, 'rows': rows,
+                            **({'children': children} if 'repeater' in scenario else {}), **best})
+    return results
+
+
+def compare_results(results, baseline, tolerance):
+    """
+    Regressions of results against a baseline run of the same benchmark, entries are matched on their
+    text values. *_per_sec falling or *_ms/queries/peak_kb rising by more than tolerance (0.2 = 20%) regress.
+    """
+    def identity(entry):
+        return tuple(sorted((k, v) for k, v in entry.items() if isinstance(v, str)))
+
+    baseline = {identity(entry): entry for entry in baseline}
+    regressions = []
+    for entry in results:
+        before = baseline.get(identity(entry), None)
+        if before is None:
+            continue
+        for k, value in entry.items():
+            if not isinstance(value, (int, float)) or not isinstance(before.get(k, None), (int, float)):
+                continue
+            if k.endswith('per_sec'):
+                regressed = value < before[k] * (1 - tolerance)
+            elif k.endswith('_ms') or k in ('queries', 'peak_kb'):
+                regressed = value > before[k] * (1 + tolerance)
+            else:
+                continue
+            if regressed:
+                regressions.append(f"{dict(identity(entry))} {k}: {before[k]} -> {value}")
+    return regressions
+
+
+def bench_representation(rows, repeat):
+    seed_data(rows)
+    employees = list(Employee.objects.select_related('department'))
+    departments = list(Department.objects.prefetch_related('employees'))
+    cases = (
+        ('EmployeeListRetrieveSerializer', LegacyEmployeeListRetrieveSerializer,
+         EmployeeListRetrieveSerializer, employees),
+        ('DepartmentListRetrieveSerializer', LegacyDepartmentListRetrieveSerializer,
+         DepartmentListRetrieveSerializer, departments),
+    )
+    results = []
+    for name, before, after, objs in cases:
+        results.append({
+            'serializer': name,
+            'rows': len(objs),
+            'before_rows_per_sec': rows_per_second(lambda: before(objs, many=True).data, len(objs), repeat),
+            'after_rows_per_sec': rows_per_second(lambda: after(objs, many=True).data, len(objs), repeat),
+        })
+    return results
+
+
+def bench_values_fast_path(rows, repeat):
+    """get_data of EmployeeListRetrieveSerializer, query included: model instances vs values_list columns"""
+    seed_data(rows)
+    queryset = Employee.objects.order_by('pk')
+    plan = get_values_plan(EmployeeListRetrieveSerializer)
+    return [{
+        'serializer': 'EmployeeListRetrieveSerializer',
+        'rows': rows,
+        'before_rows_per_sec': rows_per_second(
+            lambda: EmployeeListRetrieveSerializer(queryset.select_related('department'), many=True).data, rows, repeat),
+        'after_rows_per_sec': rows_per_second(lambda: list(iter_values_representation(queryset, plan)), rows, repeat),
+    }]
+
+
+def bench_renderer(repeat, sizes=(10000, 100000)):
+    """
+    Rendering the get_data envelope (data and form_configs) of employee and department listings of sizes rows,
+    JSONRenderer vs CRUDJSONRenderer (orjson installed)
+    """
+    seed_data(max(sizes))
+    form_configs = build_form_configs(EmployeeCreateUpdateSerializer)
+    employees = list(Employee.objects.select_related('department').order_by('pk'))
+    departments = list(Department.objects.prefetch_related('employees').order_by('pk'))
+    renderer, crud_renderer = JSONRenderer(), CRUDJSONRenderer()
+    results = []
+    for size in sizes:
+        for listing, data in (
+                ('employee', EmployeeListRetrieveSerializer(employees[:size], many=True).data),
+                ('department', DepartmentListRetrieveSerializer(departments[:size // 50], many=True).data)):
+            response = {'data': data, 'form_configs': form_configs}
+            results.append({
+                'listing': listing,
+                'size': f'{size // 1000}k',
+                'rows': size,
+                'bytes': len(renderer.render(response)),
+                'before_rows_per_sec': rows_per_second(lambda: renderer.render(response), size, repeat),
+                'after_rows_per_sec': rows_per_second(lambda: crud_renderer.render(response), size, repeat),
+            })
+    return results
+
+
+def bench_validation_errors(rows, repeat):
+    """Every row fails check_empty on both fields, as a bulk import of incomplete rows does"""
+    attrs = {'name': '', 'department': None}
+
+    def validate(validator_class):
+        for _ in range(rows):
+            validator = validator_class(model=Employee, instance=None)
+            validator.set_attrs(attrs)
+            validator.check_empty('name', 'department')
+
+    return [{
+        'validator': 'DjangoSerializerValidator',
+        'rows': rows,
+        'before_rows_per_sec': rows_per_second(lambda: validate(LegacyDjangoSerializerValidator), rows, repeat),
+        'after_rows_per_sec': rows_per_second(lambda: validate(DjangoSerializerValidator), rows, repeat),
+    }]
+
+
+def bench_async_views(rows, repeat, concurrency=50):
+    """
+    Requests/sec of concurrent fetch_record calls through the ASGI handler, as uvicorn serves them.
+    Sync views run on the shared sync thread, async views await the async ORM.
+    """
+    seed_data(rows)
+    rec_ids = [str(pk + 10000) for pk in Employee.objects.values_list('pk', flat=True)[:concurrency]]
+
+    async def fetch_all(url):
+        client = AsyncClient()
+        responses = await asyncio.gather(*[client.get(url, {'action': 'fetch_record', 'rec_id': rec_id})
+                                           for rec_id in rec_ids])
+        assert all(response.status_code == 200 for response in responses)
+
+    results = []
+    for name, url_name in (('EmployeeView', 'employee'), ('AsyncEmployeeView', 'async_employee')):
+        results.append({
+            'view': name,
+            'concurrency': len(rec_ids),
+            'requests_per_sec': rows_per_second(lambda: asyncio.run(fetch_all(reverse(url_name))), len(rec_ids),
+                                                repeat),
+        })
+    return results
+
+
+def bench_lookup_indexes(rows, repeat):
+    """
+    Query plans and timings of the check_exists lookups and the live listing, run with --rows 1000000.
+    icontains/iexact scan the table, LOWER(name) = value uses employee_name_live_idx.
+    """
+    seed_data(rows, deleted_every=10)
+    value = f'employee {rows // 2 + 1}'
+    validator = DjangoSerializerValidator(model=Employee, instance=None)
+    queries = (
+        ('check_exists icontains (before)', Employee.objects.filter(name__icontains=value)),
+        ('check_exists iexact', Employee.objects.filter(name__iexact=value)),
+        ('check_exists lower equality (after)', validator.get_exists_queryset('name', value)),
+        ('get_data first page', Employee.objects.order_by('pk')[:50]),
+    )
+    return [{
+        'query': name,
+        'rows': rows,
+        'plan': qs.explain(),
+        'best_ms': best_ms(lambda: list(qs.all()), repeat),
+    } for name, qs in queries]
+
+
+BENCHMARKS = {
+    'views': bench_views,
+    'lookup_indexes': bench_lookup_indexes,
+    'async_views': bench_async_views,
+    'representation': bench_representation,
+    'values_fast_path': bench_values_fast_path,
+    'validation_errors': bench_validation_errors,
+    'renderer': bench_renderer,
+}
@@ -0,0 +1,81 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+class ResponseCache:
+    """
+    Read cache of GenericAPICRUDView GET payloads.
+    alias None keeps an in-process TTL + LRU store, otherwise entries go to the Django cache of that alias.
+    Keys embed the ModelVersion of every model the response depends on, the versions the ETag is built from,
+    so a write in any process (bumping the version) makes stale keys unreachable and they age out.
+    """
+
+    def __init__(self, alias=None, timeout=300, max_entries=1000):
+        self.alias = alias
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        return caches[self.alias] if self.alias else None
+
+    def make_key(self, parts, versions=None):
+        """versions: {label: (version, updated_at)} of ModelVersion.get_versions, None for time bounded entries"""
+        raw = repr((parts, sorted((versions or {}).items())))
+        return f'response_cache:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def get(self, key):
+        if self.backend is None:
+            with self.lock:
+                entry = self.entries.get(key, None)
+                if entry is not None and entry[0] <= time.monotonic():
+                    del self.entries[key]
+                    entry = None
+                if entry is not None:
+                    self.entries.move_to_end(key)
+            value = entry[1] if entry is not None else None
+        else:
+            value = self.backend.get(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value, timeout=None):
+        value = {k: list(v) if isinstance(v, ReturnList) else dict(v) if isinstance(v, ReturnDict) else v
+                 for k, v in value.items()}
+        timeout = self.timeout if timeout is None else timeout
+        if self.backend is not None:
+            self.backend.set(key, value, timeout)
+            return value
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+        if self.backend is not None:
+            self.backend.clear()
+
+
+response_cache = ResponseCache(**{k.lower(): v for k, v in getattr(settings, 'RESPONSE_CACHE', {}).items()})
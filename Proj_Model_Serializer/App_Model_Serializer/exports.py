@@ -0,0 +1,145 @@
+import csv
+import json
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+from .rec_id import FOREIGN_KEY_FIELD
+
+EXPORT_VIEWS = {
+    'employee': 'App_Model_Serializer.views.EmployeeView',
+    'department': 'App_Model_Serializer.views.DepartmentView',
+}
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+
+def get_pk_ranges(queryset, parts):
+    """[low, high) pk ranges splitting queryset into parts of about the same row count, high None for the last"""
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    count = pks.count()
+    if not count:
+        return []
+    parts = max(1, min(parts, count))
+    bounds = [pks[count * i // parts] for i in range(1, parts)]
+    lows = [pks.first()] + bounds
+    return list(zip(lows, bounds + [None]))
+
+
+def get_export_view(view_path):
+    view = import_string(view_path)()
+    view.format_kwarg = None
+    return view
+
+
+def get_columns(view):
+    """CSV header, FK stubs flattened to field.value/field.salt/field.label, nested lists kept as JSON"""
+    child = view.get_list_serializer(many=True).child
+    columns = []
+    for k, kind, field, attname, related_model in child.representation_plan:
+        columns += [f'{k}.value', f'{k}.salt', f'{k}.label'] if kind == FOREIGN_KEY_FIELD else [k]
+    return columns + ['rec_id', 'salt']
+
+
+def flatten_row(data):
+    row = dict()
+    for k, v in data.items():
+        if isinstance(v, dict):
+            row.update({f'{k}.{sub_key}': sub_value for sub_key, sub_value in v.items()})
+        elif isinstance(v, list):
+            row[k] = json.dumps(v, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+        else:
+            row[k] = v
+    return row
+
+
+def iter_representation(view, low, high, chunk_size):
+    """to_representation of the live rows of [low, high) in pk order, through values_list when the view allows it"""
+    # Imported here, spawned workers unpickle export_range before init_export_worker sets django up
+    from .query_plan import iter_values_representation
+
+    pk_range = {'pk__gte': low, **({'pk__lt': high} if high is not None else {})}
+    values_plan = view.get_values_plan()
+    if values_plan is not None:
+        yield from iter_values_representation(view.get_queryset().filter(**pk_range).order_by('pk'), values_plan)
+        return
+    child = view.get_list_serializer(many=True).child
+    rows = view.get_list_queryset().filter(**pk_range).order_by('pk').iterator(chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        yield from (child.to_representation(row) for row in chunk)
+
+
+def export_range(view_path, low, high, path, export_format, chunk_size=2000):
+    """Writes one part file, header-less for csv, returns its row count"""
+    view = get_export_view(view_path)
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        # A null FK flattens to its bare name, ignored, its .value/.salt/.label columns stay empty
+        writer = csv.DictWriter(f, get_columns(view), extrasaction='ignore') if export_format == 'csv' else None
+        for data in iter_representation(view, low, high, chunk_size):
+            if writer is not None:
+                writer.writerow(flatten_row(data))
+            else:
+                f.write(json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')) + '\n')
+            count += 1
+    return count
+
+
+def init_export_worker(database_names):
+    # Spawned workers start from scratch, test/benchmark databases are renamed at runtime
+    django.setup()
+    for alias, name in database_names.items():
+        settings.DATABASES[alias]['NAME'] = name
+
+
+def export_view(view_path, directory, export_format='ndjson', workers=None, parts=None, concatenate=True,
+                chunk_size=2000):
+    """
+    Exports the live rows of a CRUD view to directory as pk range part files, written in parallel by
+    workers spawned processes, each with its own database connections. workers=1 runs in process.
+    Parts are concatenated into export.<format> when concatenate is set, manifest.json lists them either way.
+    """
+    workers = workers or os.cpu_count() or 1
+    parts = parts or workers
+    view = get_export_view(view_path)
+    ranges = get_pk_ranges(view.get_queryset(), parts)
+    os.makedirs(directory, exist_ok=True)
+    paths = [os.path.join(directory, f'part-{i:05d}.{export_format}') for i in range(len(ranges))]
+    jobs = [(view_path, low, high, path, export_format, chunk_size) for (low, high), path in zip(ranges, paths)]
+    if workers == 1 or len(jobs) <= 1:
+        counts = [export_range(*job) for job in jobs]
+    else:
+        database_names = {alias: connections[alias].settings_dict['NAME'] for alias in connections}
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_export_worker, initargs=(database_names,)) as executor:
+            counts = list(executor.map(export_range, *zip(*jobs)))
+    manifest = {
+        'view': view_path,
+        'format': export_format,
+        'rows': sum(counts),
+        'columns': get_columns(view) if export_format == 'csv' else None,
+        'parts': [{'path': os.path.basename(path), 'low': low, 'high': high, 'rows': count}
+                  for (low, high), path, count in zip(ranges, paths, counts)],
+        'path': None,
+    }
+    if concatenate:
+        manifest['path'] = f'export.{export_format}'
+        with open(os.path.join(directory, manifest['path']), 'w', newline='', encoding='utf-8') as f:
+            if export_format == 'csv':
+                csv.DictWriter(f, manifest['columns']).writeheader()
+            for path in paths:
+                with open(path, encoding='utf-8') as part:
+                    shutil.copyfileobj(part, f)
+                os.remove(path)
+        manifest['parts'] = []
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
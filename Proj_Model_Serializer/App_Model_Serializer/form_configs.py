@@ -0,0 +1,103 @@
+from rest_framework import fields as drf_fields
+from rest_framework.relations import PrimaryKeyRelatedField, ManyRelatedField
+
+from .cache import ResponseCache
+from .models import ModelVersion
+from .rec_id import rec_id_codec
+from .serializer import get_serializer_signature
+
+# Most specific DRF field classes first, EmailField is a CharField etc.
+FIELD_TYPES = (
+    (drf_fields.BooleanField, 'checkbox'),
+    (drf_fields.EmailField, 'email'),
+    (drf_fields.URLField, 'url'),
+    (drf_fields.ChoiceField, 'select'),
+    (drf_fields.CharField, 'text'),
+    (drf_fields.IntegerField, 'number'),
+    (drf_fields.FloatField, 'number'),
+    (drf_fields.DecimalField, 'number'),
+    (drf_fields.DateTimeField, 'datetime-local'),
+    (drf_fields.DateField, 'date'),
+    (drf_fields.TimeField, 'time'),
+    (drf_fields.FileField, 'file'),
+)
+
+_form_schemas = dict()
+options_cache = ResponseCache(timeout=300, max_entries=100)
+
+
+def get_field_type(field):
+    if isinstance(field, ManyRelatedField):
+        return 'multiselect'
+    if isinstance(field, PrimaryKeyRelatedField):
+        return 'select'
+    for field_class, field_type in FIELD_TYPES:
+        if isinstance(field, field_class):
+            return field_type
+    return 'text'
+
+
+def get_field_rules(field):
+    rules = {'required': field.required}
+    for attr, rule in (('max_length', 'maxLength'), ('min_length', 'minLength'),
+                       ('max_value', 'max'), ('min_value', 'min')):
+        if getattr(field, attr, None) is not None:
+            rules[rule] = getattr(field, attr)
+    return rules
+
+
+def build_form_schema(serializer, exclude=()):
+    schema = []
+    for k, v in serializer.fields.items():
+        if v.read_only or k in exclude:
+            continue
+        config = {'name': k, 'label': v.label, 'type': get_field_type(v), 'rules': get_field_rules(v)}
+        related_model = None
+        if isinstance(v, ManyRelatedField):
+            related_model = v.child_relation.get_queryset().model
+        elif isinstance(v, PrimaryKeyRelatedField):
+            related_model = v.get_queryset().model
+        elif isinstance(v, drf_fields.ChoiceField):
+            config['options'] = [{'value': value, 'label': str(label)} for value, label in v.choices.items()]
+        schema.append((config, related_model))
+    return tuple(schema)
+
+
+def get_form_schema(serializer_class, exclude=()):
+    """(field config, FK/M2M model) pairs of a create/update serializer class, introspected once per class"""
+    key = (serializer_class, tuple(exclude))
+    signature = get_serializer_signature(serializer_class)
+    cached = _form_schemas.get(key)
+    if cached is None or cached[0] != signature:
+        cached = _form_schemas[key] = (signature, build_form_schema(serializer_class(), exclude))
+    return cached[1]
+
+
+def get_options(model):
+    """rec_id/label pairs of model, cached until its ModelVersion changes"""
+    key = options_cache.make_key(('options', model._meta.label_lower), ModelVersion.get_versions({model}))
+    cached = options_cache.get(key)
+    if cached is None:
+        options = [{'value': rec_id_codec.encode(inst.pk), 'label': str(inst)}
+                   for inst in model._default_manager.order_by('pk')]
+        cached = options_cache.set(key, {'options': options})
+    return cached['options']
+
+
+def get_form_fields(serializer_class, exclude=()):
+    form_fields = []
+    for config, related_model in get_form_schema(serializer_class, exclude):
+        if related_model is not None:
+            config = {**config, 'options': get_options(related_model)}
+        form_fields.append(config)
+    return form_fields
+
+
+def build_form_configs(serializer_class, repeaters=None, repeater_instance_key=None):
+    """React Hook Form configs of a create/update serializer, repeaters nested under their payload key"""
+    form_configs = {'fields': get_form_fields(serializer_class)}
+    if repeaters:
+        exclude = (repeater_instance_key,) if repeater_instance_key else ()
+        form_configs['repeaters'] = {repeater: {'fields': get_form_fields(repeater_serializer_class, exclude)}
+                                     for repeater, repeater_serializer_class in repeaters.items()}
+    return form_configs
@@ -0,0 +1,103 @@
+import csv
+import json
+import os
+from itertools import islice
+
+from django.db import transaction
+
+from .models import ModelVersion
+from .rec_id import rec_id_codec
+from .serializer import EmployeeCreateUpdateSerializer, DepartmentCreateUpdateSerializer, \
+    DjangoBatchSerializerValidator, get_relation_fields, get_related_instances
+
+IMPORT_SERIALIZERS = {
+    'employee': EmployeeCreateUpdateSerializer,
+    'department': DepartmentCreateUpdateSerializer,
+}
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+
+def get_import_format(name, default='csv'):
+    extension = os.path.splitext(name or '')[1].lstrip('.').lower()
+    return extension if extension in IMPORT_FORMATS else default
+
+
+def read_rows(stream, import_format):
+    """
+    (row number, row) of a text stream, one line in memory at a time.
+    NDJSON lines that are not a JSON object are yielded as None, blank lines are skipped.
+    """
+    if import_format == 'csv':
+        yield from enumerate(csv.DictReader(stream), start=1)
+        return
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+def read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return {'row': 0, 'created': 0, 'errors': 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_checkpoint(path, checkpoint):
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def import_chunk(serializer_class, chunk, context=None):
+    """
+    Validates and inserts one chunk of (row number, row), all or nothing.
+    rec_ids are decoded, FK targets loaded with one in_bulk and check_exists resolved with one query per field,
+    valid rows go in with bulk_create. Returns (created, [(row number, errors)]).
+    """
+    model = serializer_class.Meta.model
+    relation_fields = [(k, kind) for k, kind, queryset in get_relation_fields(serializer_class)]
+    errors = [(number, {'non_field_errors': ['Invalid row']}) for number, row in chunk if row is None]
+    chunk = [(number, row) for number, row in chunk if row is not None]
+    rows = rec_id_codec.decode_rows([row for number, row in chunk], relation_fields)
+    batch = DjangoBatchSerializerValidator(model=model, rows=rows)
+    context = {**(context or {}), 'batch': batch, 'related_instances_complete': True,
+               'related_instances': get_related_instances(serializer_class, rows)}
+    objs = []
+    for index, ((number, _), row) in enumerate(zip(chunk, rows)):
+        s = serializer_class(data=row, context={**context, 'batch_index': index})
+        if s.is_valid():
+            objs.append(model(**{**s.validated_data, **s.sv.enc_attrs}))
+        else:
+            errors.append((number, s.errors))
+    if objs:
+        model.objects.bulk_create(objs)
+        ModelVersion.bump(model)
+    return len(objs), sorted(errors, key=lambda error: error[0])
+
+
+def import_rows(serializer_class, rows, chunk_size=1000, checkpoint=None, on_error=None, on_checkpoint=None,
+                context=None):
+    """
+    Imports (row number, row) pairs chunk by chunk, each chunk committed on its own.
+    Rows up to checkpoint['row'] were imported by an earlier run and are skipped.
+    on_error(row number, errors) gets every invalid row, on_checkpoint(checkpoint) runs after every commit.
+    """
+    checkpoint = dict(checkpoint or {'row': 0, 'created': 0, 'errors': 0})
+    rows = ((number, row) for number, row in rows if number > checkpoint['row'])
+    while chunk := list(islice(rows, chunk_size)):
+        with transaction.atomic():
+            created, errors = import_chunk(serializer_class, chunk, context)
+        checkpoint['row'] = chunk[-1][0]
+        checkpoint['created'] += created
+        checkpoint['errors'] += len(errors)
+        if on_error is not None:
+            for number, row_errors in errors:
+                on_error(number, row_errors)
+        if on_checkpoint is not None:
+            on_checkpoint(dict(checkpoint))
+    return checkpoint
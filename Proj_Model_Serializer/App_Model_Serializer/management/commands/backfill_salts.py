@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from App_Model_Serializer.models import Employee, Department, generate_salts
+
+MODELS = {model._meta.model_name: model for model in (Employee, Department)}
+
+
+class Command(BaseCommand):
+    help = 'Fill missing salts in chunks, soft deleted rows included'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', choices=sorted(MODELS))
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for name in options['models'] or sorted(MODELS):
+            model = MODELS[name]
+            # bulk_update goes through MyQuerySet.update, which bumps the ModelVersion
+            filled = self.backfill(model, options['chunk_size'])
+            self.stdout.write(f'{model._meta.label}: {filled} salts filled')
+
+    def backfill(self, model, chunk_size):
+        """Keyset walk by pk, one SELECT + one bulk_update per chunk"""
+        queryset = model.all_objects.filter(Q(salt__isnull=True) | Q(salt='')).order_by('pk').only('pk')
+        filled, last_pk = 0, 0
+        while True:
+            objs = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+            if not objs:
+                return filled
+            for obj, salt in zip(objs, generate_salts(len(objs))):
+                obj.salt = salt
+            with transaction.atomic():
+                model.all_objects.bulk_update(objs, ['salt'], batch_size=chunk_size)
+            filled += len(objs)
+            last_pk = objs[-1].pk
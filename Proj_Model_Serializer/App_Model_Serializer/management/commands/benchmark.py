@@ -0,0 +1,45 @@
+import inspect
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from App_Model_Serializer.benchmarks import BENCHMARKS, compare_results
+
+
+class Command(BaseCommand):
+    help = 'Run serializer/view benchmarks against a throw-away test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--requests', type=int, default=20, help='requests per scenario of the views benchmark')
+        parser.add_argument('--children', type=int, default=50, help='repeater rows per post of the views benchmark')
+        parser.add_argument('--output', help='write the JSON results to this file, e.g. to keep as a baseline')
+        parser.add_argument('--baseline', help='JSON results of an earlier run, regressions fail the command')
+        parser.add_argument('--tolerance', type=float, default=0.2)
+
+    def handle(self, *args, **options):
+        benchmark = BENCHMARKS[options['benchmark']]
+        parameters = inspect.signature(benchmark).parameters
+        kwargs = {k: options[k] for k in ('rows', 'repeat', 'requests', 'children') if k in parameters}
+        old_name = connection.settings_dict['NAME']
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = benchmark(**kwargs)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                regressions = compare_results(results, json.load(f), options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against {}:\n{}'.format(options['baseline'], '\n'.join(regressions)))
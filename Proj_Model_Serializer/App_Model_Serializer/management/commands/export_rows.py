@@ -0,0 +1,25 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from App_Model_Serializer.exports import EXPORT_VIEWS, EXPORT_FORMATS, export_view
+
+
+class Command(BaseCommand):
+    help = 'Export the live rows of a CRUD view as pk range parts written by a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('view', choices=sorted(EXPORT_VIEWS))
+        parser.add_argument('directory')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson')
+        parser.add_argument('--workers', type=int, help='processes, one per core by default')
+        parser.add_argument('--parts', type=int, help='pk ranges, one per worker by default')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--no-concatenate', action='store_false', dest='concatenate',
+                            help='keep the part files, listed in manifest.json')
+
+    def handle(self, *args, **options):
+        manifest = export_view(EXPORT_VIEWS[options['view']], options['directory'], options['format'],
+                               workers=options['workers'], parts=options['parts'],
+                               concatenate=options['concatenate'], chunk_size=options['chunk_size'])
+        self.stdout.write(json.dumps(manifest, indent=2))
@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from App_Model_Serializer.imports import IMPORT_SERIALIZERS, IMPORT_FORMATS, get_import_format, read_rows, \
+    import_rows, read_checkpoint, write_checkpoint
+
+
+class Command(BaseCommand):
+    help = 'Import a CSV/NDJSON file through the create serializer of a model, chunk by chunk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(IMPORT_SERIALIZERS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='taken from the file extension by default')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--checkpoint', help='progress file, an interrupted import resumes from it')
+        parser.add_argument('--errors', help='NDJSON report of the invalid rows, appended to on resume')
+
+    def handle(self, *args, **options):
+        checkpoint = read_checkpoint(options['checkpoint'])
+        errors_file = open(options['errors'], 'a' if checkpoint['row'] else 'w') if options['errors'] else None
+
+        def on_error(number, errors):
+            if errors_file is not None:
+                errors_file.write(json.dumps({'row': number, 'errors': errors}) + '\n')
+
+        def on_checkpoint(checkpoint):
+            if errors_file is not None:
+                errors_file.flush()
+            if options['checkpoint']:
+                write_checkpoint(options['checkpoint'], checkpoint)
+            self.stdout.write(f"row {checkpoint['row']}: {checkpoint['created']} created, "
+                              f"{checkpoint['errors']} invalid")
+
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as f:
+                checkpoint = import_rows(
+                    IMPORT_SERIALIZERS[options['model']], read_rows(f, options['format'] or
+                                                                    get_import_format(options['path'])),
+                    chunk_size=options['chunk_size'], checkpoint=checkpoint, on_error=on_error,
+                    on_checkpoint=on_checkpoint)
+        finally:
+            if errors_file is not None:
+                errors_file.close()
+        self.stdout.write(json.dumps(checkpoint))
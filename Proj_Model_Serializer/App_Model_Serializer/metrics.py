@@ -0,0 +1,189 @@
+import bisect
+import contextvars
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Upper bounds in ms, the last bucket is open ended
+HISTOGRAM_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+PERCENTILES = (50, 90, 99)
+
+_request_metrics = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Counters of one request, filled by the connection execute wrapper, the serializers and the view.
+    Duplicates are queries whose SQL (parameters aside) already ran in the request, the N+1 pattern.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.view = None
+        self.action = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.sql = dict()
+        self.serializer_time = 0.0
+        self.rows = 0
+
+    @property
+    def duplicate_queries(self):
+        return self.queries - len(self.sql)
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        self.sql[sql] = self.sql.get(sql, 0) + 1
+
+    def add_serialized(self, rows, duration):
+        self.rows += rows
+        self.serializer_time += duration
+
+    def get_server_timing(self, total_time):
+        return ', '.join((
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries, {self.duplicate_queries} duplicate"',
+            f'serializer;dur={self.serializer_time * 1000:.2f};desc="{self.rows} rows"',
+            f'total;dur={total_time * 1000:.2f}',
+        ))
+
+
+def get_request_metrics():
+    return _request_metrics.get()
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _request_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - started_at)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        self.total = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(HISTOGRAM_BUCKETS, value)] += 1
+        self.total += value
+
+    def percentile(self, percentile):
+        """Upper bound of the bucket holding the percentile, None past the last bound"""
+        rank = sum(self.counts) * percentile / 100
+        seen = 0
+        for bound, count in zip(HISTOGRAM_BUCKETS + (None,), self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self):
+        count = sum(self.counts)
+        return {
+            'count': count,
+            'mean': round(self.total / count, 3) if count else None,
+            **{f'p{percentile}': self.percentile(percentile) for percentile in PERCENTILES},
+            'buckets': {str(bound): count for bound, count in zip(HISTOGRAM_BUCKETS + ('inf',), self.counts)},
+        }
+
+
+class MetricsRegistry:
+    """In-process aggregate of RequestMetrics per (view, action), fixed buckets keep memory and cost flat"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = dict()
+
+    def record(self, metrics, total_time, status_code):
+        key = (metrics.view, metrics.action)
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is None:
+                entry = self.entries[key] = {
+                    'requests': 0, 'errors': 0, 'queries': 0, 'max_queries': 0, 'duplicate_queries': 0, 'rows': 0,
+                    'total_ms': Histogram(), 'db_ms': Histogram(), 'serializer_ms': Histogram(),
+                }
+            entry['requests'] += 1
+            entry['errors'] += status_code >= 500
+            entry['queries'] += metrics.queries
+            entry['max_queries'] = max(entry['max_queries'], metrics.queries)
+            entry['duplicate_queries'] += metrics.duplicate_queries
+            entry['rows'] += metrics.rows
+            entry['total_ms'].add(total_time * 1000)
+            entry['db_ms'].add(metrics.db_time * 1000)
+            entry['serializer_ms'].add(metrics.serializer_time * 1000)
+
+    def snapshot(self):
+        with self.lock:
+            return [{'view': view, 'action': action,
+                     **{k: v.snapshot() if isinstance(v, Histogram) else v for k, v in entry.items()}}
+                    for (view, action), entry in sorted(self.entries.items(), key=lambda item: repr(item[0]))]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class MetricsMiddleware:
+    """
+    Collects RequestMetrics of every request the CRUD views mark with a view/action, adds the Server-Timing
+    header and records them in metrics_registry. Other requests only pay for the context variable.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_metrics.reset(token)
+        return self.finish(metrics, response)
+
+    async def __acall__(self, request):
+        metrics, token = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_metrics.reset(token)
+        return self.finish(metrics, response)
+
+    def start(self):
+        metrics = RequestMetrics() if METRICS['ENABLED'] else None
+        return metrics, _request_metrics.set(metrics)
+
+    def finish(self, metrics, response):
+        if metrics is None or metrics.view is None:
+            return response
+        total_time = time.perf_counter() - metrics.started_at
+        if METRICS['SERVER_TIMING']:
+            response['Server-Timing'] = metrics.get_server_timing(total_time)
+        metrics_registry.record(metrics, total_time, response.status_code)
+        return response
+
+
+METRICS = {'ENABLED': True, 'SERVER_TIMING': True, **getattr(settings, 'METRICS', {})}
+metrics_registry = MetricsRegistry()
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.6 on 2026-10-18 13:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Department',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('salt', models.CharField(blank=True, max_length=100, null=True)),
+                ('is_del', models.BooleanField(default=False)),
+                ('name', models.CharField(max_length=100)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Employee',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('salt', models.CharField(blank=True, max_length=100, null=True)),
+                ('is_del', models.BooleanField(default=False)),
+                ('name', models.CharField(max_length=100)),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='employees', to='App_Model_Serializer.department')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:01
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App_Model_Serializer', '0002_model_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='department',
+            index=models.Index(condition=models.Q(('is_del', False)), fields=['id'], name='department_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='department',
+            index=models.Index(django.db.models.functions.text.Lower('name'), condition=models.Q(('is_del', False)), name='department_name_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(condition=models.Q(('is_del', False)), fields=['id'], name='employee_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(django.db.models.functions.text.Lower('name'), condition=models.Q(('is_del', False)), name='employee_name_live_idx'),
+        ),
+    ]
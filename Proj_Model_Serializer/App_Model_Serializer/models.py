@@ -1,41 +1,165 @@
-import random
-import time
-
-from django.db import models
-
+import os
+
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+
+SALT_BYTES = 16
+
+
+def generate_salts(count):
+    """count fixed width (32 hex chars) cryptographically random salts from a single os.urandom call"""
+    width = SALT_BYTES * 2
+    data = os.urandom(SALT_BYTES * count).hex()
+    return [data[i:i + width] for i in range(0, len(data), width)]
+
+
+class MyQuerySet(models.QuerySet):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """Rows without a salt get one here, bulk_create skips MyModel.save"""
+        objs = list(objs)
+        missing = [obj for obj in objs if not obj.salt]
+        for obj, salt in zip(missing, generate_salts(len(missing))):
+            obj.salt = salt
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def update(self, **kwargs):
+        """QuerySet.update skips MyModel.save, the ModelVersion of the model is bumped when rows changed"""
+        count = super().update(**kwargs)
+        if count:
+            ModelVersion.bump(self.model)
+        return count
+    update.alters_data = True
+
+    def delete(self):
+        """QuerySet.delete skips MyModel.delete, every model rows were deleted from (cascades included) is bumped"""
+        result = super().delete()
+        ModelVersion.bump_deleted(result[1])
+        return result
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def soft_delete(self):
+        """
+        is_del=True on these rows and, as on_delete=CASCADE does for delete(), on the live rows of the soft
+        deletable models pointing at them: one UPDATE per reverse relation, children first, in one transaction.
+        Every UPDATE bumps the ModelVersion of its model. Returns the number of rows of this queryset flagged.
+        """
+        with transaction.atomic(using=self.db):
+            return self._soft_delete(path=())
+
+    def _soft_delete(self, path):
+        path += (self.model,)
+        for rel in self.model._meta.related_objects:
+            related_model = rel.related_model
+            # A model already on the path (self referencing FKs) would recurse forever
+            if rel.on_delete is models.CASCADE and not rel.many_to_many and issubclass(related_model, MyModel) \
+                    and related_model not in path:
+                children = related_model.objects.filter(**{f'{rel.field.name}__in': self.values('pk')})
+                children._soft_delete(path)
+        return self.update(is_del=True)
 
 # Create your models here.
-class MyManager(models.Manager):
+class MyManager(models.Manager.from_queryset(MyQuerySet)):
 
     def get_queryset(self):
         return super().get_queryset().filter(is_del=False)
 
 
-class AllObjectsManager(models.Manager):
+class AllObjectsManager(models.Manager.from_queryset(MyQuerySet)):
 
     def get_queryset(self):
         return super().get_queryset()
 
 
+class ModelVersion(models.Model):
+    """Monotonic change version per model, read by conditional GETs instead of re-serializing the table"""
+    label = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.label} v{self.version}'
+
+    @classmethod
+    def bump(cls, *model_classes):
+        now = timezone.now()
+        for model in model_classes:
+            label = model._meta.label_lower
+            if not cls.objects.filter(label=label).update(version=F('version') + 1, updated_at=now):
+                _, created = cls.objects.get_or_create(label=label, defaults={'version': 1, 'updated_at': now})
+                if not created:
+                    cls.objects.filter(label=label).update(version=F('version') + 1, updated_at=now)
+
+    @classmethod
+    def bump_deleted(cls, counts):
+        """Bumps the models of a delete() result {model label: rows deleted}, cascaded deletes included"""
+        cls.bump(*[apps.get_model(label) for label, count in counts.items() if count])
+
+    @classmethod
+    def get_versions(cls, model_classes):
+        """{label: (version, updated_at)} of model_classes with one query, unseen models are (0, None)"""
+        labels = sorted({model._meta.label_lower for model in model_classes})
+        versions = {label: (0, None) for label in labels}
+        for label, version, updated_at in cls.objects.filter(label__in=labels).values_list(
+                'label', 'version', 'updated_at'):
+            versions[label] = (version, updated_at)
+        return versions
+
+    @classmethod
+    async def aget_versions(cls, model_classes):
+        labels = sorted({model._meta.label_lower for model in model_classes})
+        versions = {label: (0, None) for label in labels}
+        async for label, version, updated_at in cls.objects.filter(label__in=labels).values_list(
+                'label', 'version', 'updated_at'):
+            versions[label] = (version, updated_at)
+        return versions
+
+
+def live_lower_index(field, name):
+    """Index on LOWER(field) of rows that are not soft deleted, backs the case-insensitive check_exists lookups"""
+    return models.Index(Lower(field), condition=Q(is_del=False), name=name)
+
+
 class MyModel(models.Model):
     salt = models.CharField(max_length=100, null=True, blank=True)
     is_del = models.BooleanField(default=False)
     objects = MyManager()
     all_objects = AllObjectsManager()
+    # Column __str__ returns, lets listings read related labels with values_list instead of instances
+    label_field = None
 
     class Meta:
         abstract = True
+        indexes = [
+            # Every MyManager query filters is_del=False, listings and cursors order by pk
+            models.Index(fields=['id'], condition=Q(is_del=False), name='%(class)s_live_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.salt:
-            self.salt = f"{time.time()}{random.random()}"
+            self.salt = generate_salts(1)[0]
         super().save(*args, **kwargs)
+        ModelVersion.bump(self.__class__)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        ModelVersion.bump_deleted(result[1])
+        return result
 
 
 class Employee(MyModel):
     name = models.CharField(max_length=100)
     department = models.ForeignKey('Department', on_delete=models.CASCADE, null=True,
                                    blank=True, related_name='employees')
+    label_field = 'name'
+
+    class Meta(MyModel.Meta):
+        indexes = MyModel.Meta.indexes + [live_lower_index('name', 'employee_name_live_idx')]
 
     def __str__(self):
         return self.name
@@ -43,6 +167,10 @@ class Employee(MyModel):
 
 class Department(MyModel):
     name = models.CharField(max_length=100)
+    label_field = 'name'
+
+    class Meta(MyModel.Meta):
+        indexes = MyModel.Meta.indexes + [live_lower_index('name', 'department_name_live_idx')]
 
     def __str__(self):
         return self.name
@@ -0,0 +1,184 @@
+import time
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework.fields import Field
+from rest_framework.relations import PrimaryKeyRelatedField, ManyRelatedField
+from rest_framework.serializers import ListSerializer, ModelSerializer
+
+from .metrics import get_request_metrics
+from .rec_id import FOREIGN_KEY_FIELD, rec_id_codec
+from .serializer import DjangoRepresentationMixin, get_serializer_signature, get_field_kind, get_model_field, \
+    PLAIN_FIELD
+
+_query_plans = dict()
+_values_plans = dict()
+
+
+def get_query_plan(serializer_class):
+    """
+    (select_related lookups, [(prefetch lookup, related model, nested plan)], only columns) of a serializer class.
+    Built once per class from its fields, nested serializers included. only is None when a field may read
+    anything off the instance (source='*', dotted sources, properties), the columns can not be known then.
+    """
+    signature = get_serializer_signature(serializer_class)
+    cached = _query_plans.get(serializer_class)
+    if cached is None or cached[0] != signature:
+        cached = _query_plans[serializer_class] = (signature, build_query_plan(serializer_class()))
+    return cached[1]
+
+
+def build_query_plan(serializer, prefix=''):
+    select_related, prefetch_related = [], []
+    model = serializer.Meta.model
+    only = ['salt'] if isinstance(serializer, DjangoRepresentationMixin) and serializer.include_salt else []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*' or '.' in field.source:
+            only = None
+            continue
+        lookup = f'{prefix}{field.source}'
+        if isinstance(field, PrimaryKeyRelatedField):
+            select_related.append(lookup)
+            only = add_column(model, only, field.source)
+        elif isinstance(field, ManyRelatedField):
+            related_model = model._meta.get_field(field.source).related_model
+            prefetch_related.append((lookup, related_model, ([], [], None)))
+        elif isinstance(field, ListSerializer) and isinstance(field.child, ModelSerializer):
+            model_field = model._meta.get_field(field.source)
+            nested_select_related, nested_prefetch_related, nested_only = build_query_plan(field.child)
+            if model_field.one_to_many:
+                # Prefetching a reverse FK caches the parent on every row, joining it again is wasted
+                back_reference = model_field.field.name
+                nested_select_related = [k for k in nested_select_related
+                                         if k != back_reference and not k.startswith(f'{back_reference}__')]
+                # The prefetch matches rows to their parent on the FK column
+                if nested_only is not None and back_reference not in nested_only:
+                    nested_only += (back_reference,)
+                # Nested rows rendering the FK reuse our stub, its salt and label are read off our rows
+                if back_reference in field.child.fields:
+                    label_field = getattr(model, 'label_field', None)
+                    only = add_column(model, add_column(model, only, 'salt'), label_field) if label_field else None
+            prefetch_related.append((lookup, model_field.related_model,
+                                     (nested_select_related, nested_prefetch_related, nested_only)))
+        elif isinstance(field, ModelSerializer):
+            # Columns of select_related models are read in full, only restricts our own
+            nested_select_related, nested_prefetch_related, nested_only = build_query_plan(
+                field, prefix=f'{lookup}__')
+            select_related += [lookup] + nested_select_related
+            prefetch_related += nested_prefetch_related
+            only = add_column(model, only, field.source)
+        else:
+            only = add_column(model, only, field.source)
+    return select_related, prefetch_related, tuple(dict.fromkeys(only)) if only is not None else None
+
+
+def add_column(model, only, name):
+    model_field = get_model_field(model, name)
+    if only is None or model_field is None or not model_field.concrete or model_field.many_to_many:
+        return None
+    return only + [name]
+
+
+def apply_query_plan(queryset, plan):
+    """Prefetch querysets go through the default manager, so MyManager's is_del=False filter applies"""
+    select_related, prefetch_related, only = plan
+    if only is not None:
+        queryset = queryset.only(*only)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*[
+            Prefetch(lookup, queryset=apply_query_plan(related_model._default_manager.all(), nested_plan))
+            for lookup, related_model, nested_plan in prefetch_related
+        ])
+    return queryset
+
+
+def get_query_plan_models(model, plan):
+    """Every model a planned queryset of model reads, used to invalidate cached responses"""
+    models = {model}
+    select_related, prefetch_related, only = plan
+    for lookup in select_related:
+        related_model = model
+        for part in lookup.split('__'):
+            related_model = related_model._meta.get_field(part).related_model
+            models.add(related_model)
+    for lookup, related_model, nested_plan in prefetch_related:
+        models |= get_query_plan_models(related_model, nested_plan)
+    return models
+
+
+def get_values_plan(serializer_class):
+    """
+    (values_list columns, [(field_name, kind, field, column index)], include_salt) of a flat list serializer class,
+    None when it can not be read from columns: nested serializers, M2M, method/dotted sources,
+    custom get_attribute/to_representation, or a FK to a model without label_field.
+    """
+    signature = get_serializer_signature(serializer_class)
+    cached = _values_plans.get(serializer_class)
+    if cached is None or cached[0] != signature:
+        cached = _values_plans[serializer_class] = (signature, build_values_plan(serializer_class))
+    return cached[1]
+
+
+def build_values_plan(serializer_class):
+    if serializer_class.to_representation is not DjangoRepresentationMixin.to_representation:
+        return None
+    model = serializer_class.Meta.model
+    include_salt = serializer_class.include_salt
+    columns, fields = ['pk', 'salt'] if include_salt else ['pk'], []
+    for k, v in serializer_class().fields.items():
+        if v.write_only:
+            continue
+        kind = get_field_kind(v)
+        try:
+            model_field = model._meta.get_field(v.source)
+        except FieldDoesNotExist:
+            return None
+        if kind == FOREIGN_KEY_FIELD and model_field.many_to_one and model_field.related_model.label_field:
+            fields.append((k, kind, v, len(columns)))
+            columns += [f'{v.source}__pk', f'{v.source}__salt', f'{v.source}__{model_field.related_model.label_field}']
+        elif kind == PLAIN_FIELD and model_field.concrete and not model_field.is_relation \
+                and type(v).get_attribute is Field.get_attribute:
+            fields.append((k, kind, v, len(columns)))
+            columns.append(v.source)
+        else:
+            return None
+    return tuple(columns), tuple(fields), include_salt
+
+
+def iter_values_representation(queryset, plan):
+    """DjangoRepresentationMixin.to_representation of every row of queryset, read with one values_list query"""
+    columns, fields, include_salt = plan
+    encode = rec_id_codec.encode
+    metrics = get_request_metrics()
+    for row in queryset.values_list(*columns):
+        yield values_row_representation(row, fields, encode, metrics, include_salt)
+
+
+async def aiter_values_representation(queryset, plan):
+    columns, fields, include_salt = plan
+    encode = rec_id_codec.encode
+    metrics = get_request_metrics()
+    async for row in queryset.values_list(*columns):
+        yield values_row_representation(row, fields, encode, metrics, include_salt)
+
+
+def values_row_representation(row, fields, encode, metrics=None, include_salt=True):
+    started_at = time.perf_counter() if metrics is not None else None
+    data = dict()
+    for k, kind, field, index in fields:
+        value = row[index]
+        if kind == FOREIGN_KEY_FIELD:
+            data[k] = None if value is None else {'value': encode(value), 'salt': row[index + 1],
+                                                  'label': str(row[index + 2])}
+        else:
+            data[k] = None if value is None else field.to_representation(value)
+    data['rec_id'] = encode(row[0])
+    if include_salt:
+        data['salt'] = row[1]
+    if metrics is not None:
+        metrics.add_serialized(1, time.perf_counter() - started_at)
+    return data
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+FOREIGN_KEY_FIELD = 'foreign_key'
+MANY_TO_MANY_FIELD = 'many_to_many'
+
+
+class RecIdCodec:
+    """
+    pk <-> public rec_id, rec_id = str(pk + offset).
+    Subclass and point REC_ID['CODEC'] at it for another scheme, encode/decode are the only hooks,
+    the *_many and payload helpers run on them.
+    """
+
+    def __init__(self, offset=10000):
+        self.offset = offset
+
+    def encode(self, pk):
+        return str(pk + self.offset)
+
+    def decode(self, rec_id):
+        """Raises TypeError/ValueError on a malformed rec_id"""
+        return int(rec_id) - self.offset
+
+    def decode_or_none(self, rec_id):
+        try:
+            return self.decode(rec_id)
+        except (TypeError, ValueError):
+            return None
+
+    def encode_many(self, pks):
+        encode = self.encode
+        return [encode(pk) for pk in pks]
+
+    def decode_many(self, rec_ids):
+        """Malformed rec_ids decode to None"""
+        decode = self.decode_or_none
+        return [decode(rec_id) for rec_id in rec_ids]
+
+    def decode_value(self, rec_id):
+        # Malformed values are passed through, the related field reports them as a validation error
+        pk = self.decode_or_none(rec_id)
+        return rec_id if pk is None else pk
+
+    def decode_payload(self, data, relation_fields):
+        """
+        Copy of a request payload (dict or QueryDict) with the FK rec_ids and M2M rec_id lists of
+        relation_fields ((name, kind) pairs, see serializer.get_relation_fields) decoded to pks
+        """
+        data = data.copy()
+        for name, kind in relation_fields:
+            if name not in data or not data[name]:
+                continue
+            if kind == FOREIGN_KEY_FIELD:
+                data[name] = self.decode_value(data[name])
+            elif hasattr(data, 'setlist'):
+                data.setlist(name, [self.decode_value(rec_id) for rec_id in data.getlist(name)])
+            else:
+                data[name] = [self.decode_value(rec_id) for rec_id in data[name]]
+        return data
+
+    def decode_rows(self, rows, relation_fields):
+        """decode_payload of every row of a repeater/bulk payload"""
+        return [self.decode_payload(row, relation_fields) for row in rows]
+
+
+def get_rec_id_codec():
+    options = {k.lower(): v for k, v in getattr(settings, 'REC_ID', {}).items()}
+    codec_class = import_string(options.pop('codec', 'App_Model_Serializer.rec_id.RecIdCodec'))
+    return codec_class(**options)
+
+
+rec_id_codec = get_rec_id_codec()
@@ -0,0 +1,59 @@
+from functools import lru_cache
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def dumps(value):
+    """
+    Compact UTF-8 JSON bytes of value, as JSONRenderer writes them, through orjson when it is installed.
+    Dates/times are passed through to JSONEncoder.default to keep DRF's format, values orjson rejects
+    (non str keys, ints past 64 bits) go to the standard library encoder.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=_encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            pass
+    return _encoder.encode(value).encode()
+
+
+@lru_cache(maxsize=1024)
+def encode_key(key):
+    return dumps(key) + b':'
+
+
+# Top level keys of the CRUD view responses, encoded once
+ENVELOPE_KEYS = {key: encode_key(key) for key in
+                 ('data', 'form_configs', 'success', 'form_error', 'error', 'count', 'next', 'prev')}
+
+
+class CRUDJSONRenderer(JSONRenderer):
+    """
+    Writes the dict envelope of the CRUD views ({"data": [...], "form_configs": {...}, ...}) as one list of
+    byte strings joined once: envelope keys come pre-encoded, every value is a single dumps call.
+    Without orjson, and for non dict payloads or indented, ASCII only or non compact output, this is JSONRenderer:
+    the standard library encoder gains nothing from the split envelope.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or not isinstance(data, dict) or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+                or not all(type(key) is str for key in data)):
+            return super().render(data, accepted_media_type, renderer_context)
+        parts = [b'{']
+        for key, value in data.items():
+            parts += (b',' if len(parts) > 1 else b'', ENVELOPE_KEYS.get(key) or encode_key(key), dumps(value))
+        parts.append(b'}')
+        ret = b''.join(parts)
+        # As JSONRenderer does, these two are valid JSON but not valid JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -1,58 +1,446 @@
-import inspect
-
-from django.core.exceptions import ImproperlyConfigured
-from rest_framework.exceptions import ValidationError
+import time
+
+from django.core.exceptions import ImproperlyConfigured, FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db import connections, router
+from django.db.models import Value
+from django.db.models.functions import Lower
+from rest_framework.exceptions import ValidationError, ErrorDetail
+from rest_framework.fields import SkipField
 from rest_framework.relations import PrimaryKeyRelatedField, ManyRelatedField
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import ListSerializer, ModelSerializer
 
+from .metrics import get_request_metrics
 from .models import Employee, Department
+from .rec_id import FOREIGN_KEY_FIELD, MANY_TO_MANY_FIELD, rec_id_codec
+
+
+_verbose_names = dict()
+
+
+def get_verbose_name(model, name):
+    key = (model, name)
+    if key not in _verbose_names:
+        _verbose_names[key] = model._meta.get_field(name).verbose_name.capitalize()
+    return _verbose_names[key]
 
 
 class DjangoSerializerValidator:
-    error_msg = {
-        'check_empty': '{field} is required',
-        'check_exists': '{field} is already exists',
+    # check name -> (message template, error code)
+    checks = {
+        'check_empty': ('{field} is required', 'required'),
+        'check_exists': ('{field} is already exists', 'unique'),
     }
 
-    def __init__(self, model, instance):
+    def __init__(self, model, instance, batch=None, batch_index=None, defer_exists=False):
         self.model = model
         self.instance = instance
+        self.batch = batch
+        self.batch_index = batch_index
+        self.defer_exists = defer_exists
+        self.deferred_exists = []
         self.attrs = None
         self.enc_attrs = dict()
         self.custom_errors = dict()
 
+    @classmethod
+    def register_check(cls, message, code='invalid', name=None):
+        """
+        Decorator registering func(validator, field, value), returning True when the value is invalid,
+        as validator.<name>(*fields) with its message template and error code
+        """
+        def decorator(func):
+            check_name = name or func.__name__
+            if 'checks' not in cls.__dict__:
+                cls.checks = dict(cls.checks)
+            cls.checks[check_name] = (message, code)
+
+            def check(self, *args):
+                for field in args:
+                    if func(self, field, self.attrs.get(field, None)):
+                        self.add_error(field, check_name)
+
+            check.__name__ = check_name
+            setattr(cls, check_name, check)
+            return func
+        return decorator
+
     def set_attrs(self, attrs):
         self.attrs = attrs
 
     def get_verbose_name(self, name):
-        return self.model._meta.get_field(name).verbose_name.capitalize()
+        return get_verbose_name(self.model, name)
 
-    def add_error(self, field):
-        func_name = inspect.stack()[1].frame.f_code.co_name
-        error_msg = self.error_msg[func_name].format(field=self.get_verbose_name(field))
+    def add_error(self, field, check):
+        message, code = self.checks[check]
+        error = ErrorDetail(message.format(field=self.get_verbose_name(field)), code=code)
         if field not in self.custom_errors:
-            self.custom_errors[field] = [error_msg]
+            self.custom_errors[field] = [error]
         else:
-            self.custom_errors[field].append(error_msg)
+            self.custom_errors[field].append(error)
 
     def check_empty(self, *args):
         for field in args:
             value = self.attrs.get(field, None)
             if not value or (isinstance(value, str) and not value.strip()):
-                self.add_error(field)
+                self.add_error(field, 'check_empty')
+
+    def get_exists_queryset(self, field, value):
+        # LOWER(field) = LOWER(value) matches the live_lower_index of the model, iexact can not use it.
+        # Both sides are folded by the database, SQLite's LOWER() leaves non-ASCII letters alone
+        if isinstance(value, str):
+            qs = self.model.objects.annotate(lookup=Lower(field)).filter(lookup=Lower(Value(value)))
+        else:
+            qs = self.model.objects.filter(**{field: value})
+        if self.instance is not None:
+            qs = qs.exclude(pk=self.instance.pk)
+        return qs
 
     def check_exists(self, *args):
+        """With defer_exists the lookups are only recorded, for acheck_exists to run outside of validate()"""
         for field in args:
             value = self.attrs.get(field, None)
             if value:
-                qs = self.model.objects.filter(**{f'{field}__icontains': value})
-                if self.instance is not None:
-                    qs = qs.exclude(pk=self.instance.pk)
-                if qs.exists():
-                    self.add_error(field)
+                exists = None
+                if self.batch is not None:
+                    exists = self.batch.exists(field, value, self.batch_index)
+                if exists is None and self.defer_exists:
+                    self.deferred_exists.append(field)
+                    continue
+                if exists is None:
+                    exists = self.get_exists_queryset(field, value).exists()
+                if exists:
+                    self.add_error(field, 'check_exists')
+
+    async def acheck_exists(self, *args):
+        for field in args:
+            value = self.attrs.get(field, None)
+            if value and await self.get_exists_queryset(field, value).aexists():
+                self.add_error(field, 'check_exists')
+
+
+class DjangoBatchSerializerValidator:
+    """
+    Shared by the serializers of every row of one request.
+    check_exists of a field is resolved for all rows with one case-insensitive query (after one more that lowers
+    the payload values in the database), values repeated within the payload itself are reported on every row
+    after the first.
+    """
+    lower_chunk_size = 500
+
+    def __init__(self, model, rows, instances=None):
+        self.model = model
+        self.rows = rows
+        self.instances = instances or [None] * len(rows)
+        self.existing = dict()
+        self.first_index = dict()
+        self.lowered = dict()
+
+    @staticmethod
+    def normalize(value):
+        return value.strip() if isinstance(value, str) else value
+
+    def lower(self, values):
+        """
+        {value: LOWER(value)} as the database folds case, so payload values compare with LOWER(field)
+        the same way check_exists does (SQLite's LOWER() only folds ASCII, str.lower() folds everything).
+        """
+        values = list(values)
+        lowered = dict()
+        with connections[router.db_for_read(self.model)].cursor() as cursor:
+            for start in range(0, len(values), self.lower_chunk_size):
+                chunk = values[start:start + self.lower_chunk_size]
+                cursor.execute('SELECT {}'.format(', '.join(['LOWER(%s)'] * len(chunk))), chunk)
+                lowered.update(zip(chunk, cursor.fetchone()))
+        return lowered
+
+    def resolve(self, field):
+        values = {self.normalize(row.get(field, None)) for row in self.rows}
+        lowered = self.lower(sorted(value for value in values if value and isinstance(value, str)))
+        first_index = dict()
+        for index, row in enumerate(self.rows):
+            value = self.normalize(row.get(field, None))
+            if value:
+                first_index.setdefault(lowered.get(value, value), index)
+        existing = dict()
+        if first_index:
+            qs = self.model.objects.annotate(lookup=Lower(field)).filter(lookup__in=list(first_index))
+            for pk, value in qs.values_list('pk', 'lookup'):
+                existing.setdefault(value, set()).add(pk)
+        self.existing[field] = existing
+        self.first_index[field] = first_index
+        self.lowered[field] = lowered
+
+    def exists(self, field, value, index):
+        """None when value is not part of the payload, caller then falls back to a single query"""
+        if field not in self.existing:
+            self.resolve(field)
+        value = self.normalize(value)
+        value = self.lowered[field].get(value, value)
+        if index is None or value not in self.first_index[field]:
+            return None
+        instance = self.instances[index]
+        if self.existing[field].get(value, set()) - {instance.pk if instance is not None else None}:
+            return True
+        return self.first_index[field][value] != index
+
+
+PLAIN_FIELD = 'plain'
+
+_representation_plans = dict()
+_relation_fields = dict()
+_sparse_serializers = dict()
+
+
+def get_related_stub(inst):
+    return {'value': rec_id_codec.encode(inst.id),
+            'salt': inst.salt,
+            'label': str(inst)}
+
+
+def get_field_kind(field):
+    if isinstance(field, PrimaryKeyRelatedField):
+        return FOREIGN_KEY_FIELD
+    if isinstance(field, ManyRelatedField):
+        return MANY_TO_MANY_FIELD
+    return PLAIN_FIELD
+
+
+def get_serializer_signature(serializer_class):
+    meta = getattr(serializer_class, 'Meta', None)
+    return (meta, getattr(meta, 'model', None), tuple(getattr(meta, 'fields', None) or ()),
+            tuple(getattr(meta, 'exclude', None) or ()), tuple(serializer_class._declared_fields),
+            getattr(serializer_class, 'include_salt', True))
+
+
+def get_model_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def get_representation_plan(serializer):
+    """
+    Compiled ((field_name, kind, FK attname, FK model), ...), back_referenced) of a serializer class, built once per class.
+    back_referenced: rows of a nested many serializer of a reverse FK render that FK, they reuse our stub.
+    Plan is rebuilt when Meta, its model/fields or the declared fields of the class change.
+    """
+    serializer_class = serializer.__class__
+    signature = get_serializer_signature(serializer_class)
+    cached = _representation_plans.get(serializer_class)
+    if cached is None or cached[0] != signature:
+        model = getattr(serializer_class.Meta, 'model', None)
+        plan, back_referenced = [], False
+        for k, v in serializer.fields.items():
+            if v.write_only:
+                continue
+            kind = get_field_kind(v)
+            model_field = get_model_field(model, v.source) if model and v.source != '*' else None
+            if kind == FOREIGN_KEY_FIELD and model_field is not None and model_field.many_to_one:
+                plan.append((k, kind, model_field.attname, model_field.related_model))
+                continue
+            if isinstance(v, ListSerializer) and isinstance(v.child, DjangoRepresentationMixin) \
+                    and model_field is not None and model_field.one_to_many \
+                    and model_field.field.name in v.child.fields:
+                back_referenced = True
+            plan.append((k, kind, None, None))
+        cached = _representation_plans[serializer_class] = (signature, (tuple(plan), back_referenced))
+    return cached[1]
+
+
+def get_relation_fields(serializer_class):
+    """
+    (field_name, kind, queryset) of the writable FK/M2M fields of a serializer class, built once per class.
+    Requests decode rec_ids and look up FK targets from it without instantiating the serializer.
+    """
+    signature = get_serializer_signature(serializer_class)
+    cached = _relation_fields.get(serializer_class)
+    if cached is None or cached[0] != signature:
+        relation_fields = []
+        for k, v in serializer_class().fields.items():
+            kind = get_field_kind(v)
+            if kind == FOREIGN_KEY_FIELD and not v.read_only:
+                relation_fields.append((k, kind, v.get_queryset()))
+            elif kind == MANY_TO_MANY_FIELD and not v.read_only:
+                relation_fields.append((k, kind, v.child_relation.get_queryset()))
+        cached = _relation_fields[serializer_class] = (signature, tuple(relation_fields))
+    return cached[1]
+
+
+def get_related_pks(serializer_class, rows):
+    """(queryset, pks) of every FK/M2M field referenced by decoded rows, malformed pks left to field validation"""
+    related_pks = []
+    for k, kind, queryset in get_relation_fields(serializer_class):
+        pks = set()
+        for row in rows:
+            values = row.get(k, None)
+            if values and kind == FOREIGN_KEY_FIELD:
+                values = [values]
+            elif values and hasattr(row, 'getlist'):
+                values = row.getlist(k)
+            pks.update(pk for pk in values or () if isinstance(pk, int))
+        if pks:
+            related_pks.append((queryset.all(), pks))
+    return related_pks
+
+
+def get_related_instances(serializer_class, rows):
+    """{(model, pk): instance} of every FK/M2M target referenced by rows, one in_bulk query per field"""
+    related_instances = dict()
+    for queryset, pks in get_related_pks(serializer_class, rows):
+        for pk, inst in queryset.in_bulk(pks).items():
+            related_instances[(queryset.model, pk)] = inst
+    return related_instances
+
+
+class DjangoPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    """
+    Resolves the pk from context['related_instances'] {(model, pk): instance} when present,
+    bulk paths fill it once per request/chunk instead of one queryset.get() per row.
+    With context['related_instances_complete'] a pk missing from it is reported without querying.
+    """
+
+    def to_internal_value(self, data):
+        related_instances = self.context.get('related_instances', None)
+        if related_instances is not None and not self.pk_field:
+            model = self.get_queryset().model
+            try:
+                inst = related_instances.get((model, model._meta.pk.to_python(data)), None)
+            except (DjangoValidationError, TypeError):
+                inst = None
+            if inst is not None:
+                return inst
+            if self.context.get('related_instances_complete', False):
+                self.fail('does_not_exist', pk_value=data)
+        return super().to_internal_value(data)
+
+
+class DjangoRepresentationMixin:
+    """
+    FK stubs are memoized per serialization in context['related_stubs'] {(model, pk): stub}, shared by nested
+    serializers, so a related instance is rendered once. FKs are looked up by their attname, a memo hit
+    does not load the related instance, and a parent registers its own stub for the rows nested under it.
+    Top level rows are timed and counted into the RequestMetrics of the request, when there is one.
+    Every row carries its rec_id, and its salt unless include_salt is unset (sparse fieldsets).
+    """
+    include_salt = True
+
+    @property
+    def representation_plan(self):
+        # Bound once per serializer instance, the child of many=True is shared by every row
+        if getattr(self, '_representation_plan', None) is None:
+            fields = self.fields
+            plan, back_referenced = get_representation_plan(self)
+            self._representation_plan = [(k, kind, fields[k], attname, related_model)
+                                         for k, kind, attname, related_model in plan]
+            self._back_referenced = back_referenced
+        return self._representation_plan
+
+    @property
+    def is_top_level(self):
+        if getattr(self, '_top_level', None) is None:
+            self._top_level = self.parent is None or (isinstance(self.parent, ListSerializer)
+                                                      and self.parent.parent is None)
+        return self._top_level
+
+    def to_representation(self, instance):
+        metrics = get_request_metrics()
+        if metrics is None or not self.is_top_level:
+            return self.build_representation(instance)
+        started_at = time.perf_counter()
+        data = self.build_representation(instance)
+        metrics.add_serialized(1, time.perf_counter() - started_at)
+        return data
+
+    def build_representation(self, instance):
+        # is_form = self.context.get('is_form', False)
+        data = dict()
+        representation_plan = self.representation_plan
+        related_stubs = self.context.setdefault('related_stubs', dict())
+        if self._back_referenced:
+            related_stubs[(instance.__class__, instance.pk)] = get_related_stub(instance)
+        for k, kind, field, attname, related_model in representation_plan:
+            if kind == FOREIGN_KEY_FIELD:
+                pk = getattr(instance, attname) if attname else None
+                stub = related_stubs.get((related_model, pk), None) if pk is not None else None
+                if stub is None:
+                    inst = getattr(instance, field.source, None)
+                    stub = get_related_stub(inst) if inst else None
+                    if stub is not None and attname:
+                        related_stubs[(related_model, pk)] = stub
+                data[k] = stub
+            elif kind == MANY_TO_MANY_FIELD:
+                qs = getattr(instance, k, None)
+                data[k] = [get_related_stub(inst) for inst in qs.all()]
+            else:
+                try:
+                    attribute = field.get_attribute(instance)
+                except SkipField:
+                    continue
+                data[k] = None if attribute is None else field.to_representation(attribute)
+        data['rec_id'] = rec_id_codec.encode(instance.id)
+        if self.include_salt:
+            data['salt'] = instance.salt
+        return data
 
 
-class DjangoCrudModelSerializer(ModelSerializer):
+def get_sparse_serializer_class(serializer_class, fieldsets):
+    """
+    Subclass of a list serializer class rendering the sparse fieldsets {path: field names} only, built once per
+    fieldsets. Path '' is the serializer itself, 'employees' (dotted further down) one of its nested serializers,
+    a path without a fieldset keeps all of its fields. rec_id is always rendered, salt when it is asked for.
+    Unknown paths or field names raise a ValidationError.
+    """
+    fieldsets = tuple(sorted((path, tuple(sorted(set(names)))) for path, names in fieldsets.items()))
+    key = (serializer_class, get_serializer_signature(serializer_class), fieldsets)
+    cached = _sparse_serializers.get(key)
+    if cached is None:
+        reached = set()
+        sparse_class = build_sparse_serializer_class(serializer_class, dict(fieldsets), '', reached)
+        unknown = sorted(path for path, names in fieldsets if path not in reached)
+        if unknown:
+            raise ValidationError({f'{path}.fields': 'Unknown nested serializer' for path in unknown})
+        cached = _sparse_serializers[key] = sparse_class
+    return cached
+
+
+def build_sparse_serializer_class(serializer_class, fieldsets, path, reached):
+    reached.add(path)
+    fields = serializer_class().fields
+    names = fieldsets.get(path, None)
+    if names is not None:
+        unknown = set(names) - set(fields) - {'rec_id', 'salt'}
+        if unknown:
+            raise ValidationError({f'{path}.fields' if path else 'fields':
+                                   f"Unknown fields: {', '.join(sorted(unknown))}"})
+    attrs = dict()
+    kept = [k for k in fields if names is None or k in names]
+    for k in fields:
+        # Nested serializers are declared fields, rebuilt around their sparse class with their own arguments
+        field = serializer_class._declared_fields.get(k, None)
+        nested = field.child if isinstance(field, ListSerializer) else field
+        if not isinstance(nested, DjangoRepresentationMixin):
+            continue
+        nested_path = f'{path}.{k}' if path else k
+        if k not in kept:
+            reached.add(nested_path)
+            continue
+        nested_class = build_sparse_serializer_class(nested.__class__, fieldsets, nested_path, reached)
+        if nested_class is nested.__class__:
+            continue
+        attrs[k] = nested_class(*nested._args, **nested._kwargs)
+        if nested is not field:
+            attrs[k] = field.__class__(*field._args, **{**field._kwargs, 'child': attrs[k]})
+    if names is None and not attrs:
+        return serializer_class
+    attrs['Meta'] = type('Meta', (serializer_class.Meta,), {'fields': kept, 'exclude': None})
+    attrs['include_salt'] = serializer_class.include_salt and (names is None or 'salt' in names)
+    attrs['__module__'] = serializer_class.__module__
+    return type(serializer_class)(f'Sparse{serializer_class.__name__}', (serializer_class,), attrs)
+
+
+class DjangoCrudModelSerializer(DjangoRepresentationMixin, ModelSerializer):
+    serializer_related_field = DjangoPrimaryKeyRelatedField
 
     class Meta:
         model = None
@@ -60,29 +448,13 @@ class DjangoCrudModelSerializer(ModelSerializer):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.sv = DjangoSerializerValidator(model=self.Meta.model, instance=self.instance)
+        self.sv = DjangoSerializerValidator(model=self.Meta.model, instance=self.instance,
+                                            batch=self.context.get('batch', None),
+                                            batch_index=self.context.get('batch_index', None),
+                                            defer_exists=self.context.get('defer_exists', False))
         if not self.Meta.model or not self.Meta.fields:
             raise ImproperlyConfigured(f'model or fields Missing in {self.__class__.__name__} Meta Class')
 
-    def to_representation(self, instance):
-        # is_form = self.context.get('is_form', False)
-        data = super().to_representation(instance)
-        data['rec_id'] = str(instance.id + 10000)
-        data['salt'] = instance.salt
-        for k, v in self.get_fields().items():
-            if isinstance(v, PrimaryKeyRelatedField):
-                inst = getattr(instance, k, None)
-                if inst:
-                    data[k] = {'value': str(inst.id + 10000),
-                               'salt': inst.salt,
-                               'label': str(inst)}
-            if isinstance(v, ManyRelatedField):
-                qs = getattr(instance, k, None)
-                data[k] = [{'value': str(inst.id + 10000),
-                            'salt': inst.salt,
-                            'label': str(inst)} for inst in qs.all()]
-        return data
-
     def save(self, **kwargs):
         if self.sv.enc_attrs:
             kwargs.update(self.sv.enc_attrs)
@@ -90,6 +462,7 @@ class DjangoCrudModelSerializer(ModelSerializer):
 
 
 class DjangoCreateUpdateModelSerializer(ModelSerializer):
+    serializer_related_field = DjangoPrimaryKeyRelatedField
 
     class Meta:
         model = None
@@ -97,7 +470,10 @@ class DjangoCreateUpdateModelSerializer(ModelSerializer):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.sv = DjangoSerializerValidator(model=self.Meta.model, instance=self.instance)
+        self.sv = DjangoSerializerValidator(model=self.Meta.model, instance=self.instance,
+                                            batch=self.context.get('batch', None),
+                                            batch_index=self.context.get('batch_index', None),
+                                            defer_exists=self.context.get('defer_exists', False))
         if not self.Meta.model or not self.Meta.fields:
             raise ImproperlyConfigured(f'model or fields Missing in {self.__class__.__name__} Meta Class')
 
@@ -107,26 +483,8 @@ class DjangoCreateUpdateModelSerializer(ModelSerializer):
         return super().save(**kwargs)
 
 
-class DjangoListRetrieveModelSerializer(ModelSerializer):
-
-    def to_representation(self, instance):
-        # is_form = self.context.get('is_form', False)
-        data = super().to_representation(instance)
-        data['rec_id'] = str(instance.id + 10000)
-        data['salt'] = instance.salt
-        for k, v in self.get_fields().items():
-            if isinstance(v, PrimaryKeyRelatedField):
-                inst = getattr(instance, k, None)
-                if inst:
-                    data[k] = {'value': str(inst.id + 10000),
-                               'salt': inst.salt,
-                               'label': str(inst)}
-            if isinstance(v, ManyRelatedField):
-                qs = getattr(instance, k, None)
-                data[k] = [{'value': str(inst.id + 10000),
-                            'salt': inst.salt,
-                            'label': str(inst)} for inst in qs.all()]
-        return data
+class DjangoListRetrieveModelSerializer(DjangoRepresentationMixin, ModelSerializer):
+    pass
 
 
 class EmployeeCreateUpdateSerializer(DjangoCreateUpdateModelSerializer):
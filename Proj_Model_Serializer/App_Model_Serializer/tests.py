@@ -1,3 +1,805 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import time
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import QueryDict
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import renderers
+from .admin import count_cache, estimate_count
+from .benchmarks import compare_results
+from .cache import ResponseCache, response_cache
+from .exports import export_view
+from .form_configs import get_form_fields
+from .metrics import RequestMetrics, _request_metrics, metrics_registry
+from .models import Employee, Department, ModelVersion
+from .query_plan import get_values_plan, iter_values_representation
+from .rec_id import FOREIGN_KEY_FIELD, MANY_TO_MANY_FIELD, RecIdCodec
+from .renderers import CRUDJSONRenderer
+from .serializer import DjangoSerializerValidator, EmployeeCreateUpdateSerializer, EmployeeListRetrieveSerializer, \
+    DepartmentListRetrieveSerializer, get_related_stub
+from .utils import ErrorLogWriter
+from .views import EmployeeView
+
+
+def create_departments(count, employees_per_department=3):
+    for i in range(count):
+        department = Department.objects.create(name=f'Department {i}')
+        for j in range(employees_per_department):
+            Employee.objects.create(name=f'Employee {i}.{j}', department=department)
+        Employee.objects.create(name=f'Deleted {i}', department=department, is_del=True)
+
+
+class QueryPlanTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def get_data(self, url_name):
+        response = self.client.get(reverse(url_name), {'action': 'get_data'})
+        self.assertEqual(response.status_code, 200)
+        return response.data['data']
+
+    def test_employee_get_data_query_count_is_constant(self):
+        create_departments(2)
+        # ModelVersion lookup for the ETag + the planned listing query
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.get_data('employee')), 6)
+        create_departments(20)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.get_data('employee')), 66)
+
+    def test_department_get_data_query_count_is_constant(self):
+        create_departments(2)
+        with self.assertNumQueries(3):
+            data = self.get_data('department')
+        create_departments(20)
+        with self.assertNumQueries(3):
+            data = self.get_data('department')
+        self.assertEqual(len(data), 22)
+        # is_del=True employees are left out of the nested listing
+        self.assertTrue(all(len(row['employees']) == 3 for row in data))
+
+
+class StreamingTestCase(TestCase):
+
+    def test_streamed_get_data_matches_regular_response(self):
+        create_departments(5)
+        client = APIClient()
+        for url_name in ('employee', 'department'):
+            expected = client.get(reverse(url_name), {'action': 'get_data'}).json()
+            response = client.get(reverse(url_name), {'action': 'get_data', 'stream': 'True'})
+            self.assertTrue(response.streaming)
+            self.assertEqual(json.loads(b''.join(response.streaming_content)), expected)
+
+    def test_related_stub_memo_is_per_chunk(self):
+        create_departments(1, employees_per_department=6)
+        with mock.patch.object(EmployeeView, 'stream_chunk_size', 2), \
+                mock.patch('App_Model_Serializer.serializer.get_related_stub', wraps=get_related_stub) as stub:
+            response = APIClient().get(reverse('employee'), {'action': 'get_data', 'stream': 'True'})
+            self.assertEqual(len(json.loads(b''.join(response.streaming_content))['data']), 6)
+        # The department stub is rendered once per chunk of 2 rows, the memo does not outlive its chunk
+        self.assertEqual(stub.call_count, 3)
+
+
+class CursorPaginationTestCase(TestCase):
+
+    def get_page(self, **params):
+        response = APIClient().get(reverse('employee'), {'action': 'get_data', 'page_size': 4, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_walk_forward_and_back(self):
+        create_departments(3)
+        rec_ids = [str(pk + 10000) for pk in Employee.objects.order_by('pk').values_list('pk', flat=True)]
+        pages, page = [], self.get_page()
+        self.assertIsNone(page['prev'])
+        while True:
+            pages.append([row['rec_id'] for row in page['data']])
+            if not page['next']:
+                break
+            page = self.get_page(after=page['next'])
+        self.assertEqual(sum(pages, []), rec_ids)
+        self.assertEqual(len(pages), 3)
+        page = self.get_page(before=page['prev'])
+        self.assertEqual([row['rec_id'] for row in page['data']], pages[1])
+        page = self.get_page(before=page['prev'])
+        self.assertEqual([row['rec_id'] for row in page['data']], pages[0])
+        self.assertIsNone(page['prev'])
+
+    def test_malformed_params_are_rejected(self):
+        create_departments(1)
+        client = APIClient()
+        for params, key in (({'page_size': 'abc'}, 'page_size'), ({'page_size': -3}, 'page_size'),
+                            ({'page_size': 0}, 'page_size'), ({'page_size': 4, 'after': 'zz'}, 'after'),
+                            ({'page_size': 4, 'before': 'zz'}, 'before')):
+            response = client.get(reverse('employee'), {'action': 'get_data', **params})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(set(response.data['form_error']), {key})
+
+    def test_missing_cursor_row_with_column_ordering(self):
+        create_departments(1)
+        employee = Employee.objects.order_by('name').first()
+        rec_id = str(employee.pk + 10000)
+        with mock.patch.object(EmployeeView, 'cursor_ordering', 'name'):
+            self.assertEqual(len(self.get_page(after=rec_id)['data']), 2)
+            employee.delete()
+            response = APIClient().get(reverse('employee'), {'action': 'get_data', 'page_size': 4, 'after': rec_id})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['form_error'], {'after': 'Record not found'})
+
+
+class RepeaterValidationTestCase(TestCase):
+
+    def test_names_checked_against_table_and_payload(self):
+        Employee.objects.create(name='Existing')
+        payload = {'name': 'IT', 'employees': [{'name': 'Alice'}, {'name': 'bob'}, {'name': 'Bob '},
+                                               {'name': 'existing'}, {'name': 'Exist'}]}
+        response = APIClient().post(reverse('department'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['form_error'], {
+            'employees.2.name': 'Name is already exists',
+            'employees.3.name': 'Name is already exists',
+        })
+        self.assertFalse(Department.objects.exists())
+        self.assertEqual(Employee.objects.count(), 1)
+
+    def test_non_ascii_names_checked_against_table_and_payload(self):
+        Employee.objects.create(name='Éva')
+        payload = {'name': 'IT', 'employees': [{'name': 'ÉVA'}, {'name': 'Zoë'}, {'name': 'ZOë'}, {'name': 'Ørjan'}]}
+        response = APIClient().post(reverse('department'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['form_error'], {
+            'employees.0.name': 'Name is already exists',
+            'employees.2.name': 'Name is already exists',
+        })
+
+    def test_malformed_repeater_rows_are_rejected(self):
+        client = APIClient()
+        response = client.post(reverse('department'), {'name': 'IT', 'employees': {'name': 'Alice'}}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['form_error'], {'employees': 'Expected a list'})
+        response = client.post(reverse('department'), {'name': 'IT', 'employees': [{'name': 'Alice'}, 'Bob', None]},
+                               format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['form_error'], {'employees.1': 'Expected an object',
+                                                       'employees.2': 'Expected an object'})
+        self.assertFalse(Department.objects.exists())
+
+    def test_valid_repeater_rows_are_created(self):
+        payload = {'name': 'IT', 'employees': [{'name': 'Alice'}, {'name': 'Bob'}]}
+        response = APIClient().post(reverse('department'), payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(list(Department.objects.get().employees.order_by('pk').values_list('name', flat=True)),
+                         ['Alice', 'Bob'])
+
+    def test_bulk_created_repeater_query_count_is_constant(self):
+        query_counts = []
+        for size in (1, 5, 50):
+            payload = {'name': f'Dept {size}', 'employees': [{'name': f'{size}.{i}'} for i in range(size)]}
+            with CaptureQueriesContext(connection) as queries:
+                response = APIClient().post(reverse('department'), payload, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.data['success']['employees']), size)
+            query_counts.append(len(queries))
+        # the first post also creates the ModelVersion rows
+        self.assertEqual(query_counts[1], query_counts[2])
+        self.assertFalse(Employee.objects.filter(salt__isnull=True).exists())
+
+
+class BulkWriteTestCase(TestCase):
+
+    def setUp(self):
+        create_departments(2)
+        self.employees = list(Employee.objects.order_by('pk'))
+        self.departments = list(Department.objects.order_by('pk'))
+
+    def test_bulk_update(self):
+        rows = [{'rec_id': str(employee.pk + 10000), 'name': f'Renamed {employee.pk}',
+                 'department': str(self.departments[1].pk + 10000)} for employee in self.employees[:3]]
+        response = APIClient().put(reverse('employee'), rows, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['success']), 3)
+        for employee in Employee.objects.filter(pk__in=[e.pk for e in self.employees[:3]]):
+            self.assertEqual(employee.name, f'Renamed {employee.pk}')
+            self.assertEqual(employee.department_id, self.departments[1].pk)
+
+    def test_bulk_update_errors_are_all_or_nothing(self):
+        rows = [{'rec_id': str(self.employees[0].pk + 10000), 'name': 'Fresh name',
+                 'department': str(self.departments[0].pk + 10000)},
+                {'rec_id': str(self.employees[1].pk + 10000), 'name': self.employees[2].name,
+                 'department': str(self.departments[0].pk + 10000)},
+                {'rec_id': '1', 'name': 'Missing', 'department': str(self.departments[0].pk + 10000)}]
+        response = APIClient().put(reverse('employee'), rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['form_error'], {'1.name': 'Name is already exists',
+                                                       '2.rec_id': 'Record not found'})
+        self.assertFalse(Employee.objects.filter(name='Fresh name').exists())
+
+    def test_bulk_update_duplicate_rec_ids(self):
+        rec_id = str(self.employees[0].pk + 10000)
+        rows = [{'rec_id': rec_id, 'name': 'First'}, {'rec_id': str(self.employees[1].pk + 10000), 'name': 'Other'},
+                {'rec_id': rec_id, 'name': 'Second'}]
+        response = APIClient().put(reverse('employee'), rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['form_error'], {'2.rec_id': 'Duplicate rec_id'})
+        self.assertEqual(Employee.objects.get(pk=self.employees[0].pk).name, self.employees[0].name)
+
+    def test_delete_is_soft(self):
+        client = APIClient()
+        rec_ids = [str(employee.pk + 10000) for employee in self.employees[:2]]
+        response = client.delete(reverse('employee'), {'rec_ids': rec_ids}, format='json')
+        self.assertEqual(response.data['count'], 2)
+        response = client.delete(f"{reverse('employee')}?rec_id={self.employees[2].pk + 10000}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Employee.objects.count(), len(self.employees) - 3)
+        self.assertEqual(Employee.all_objects.filter(is_del=False).count(), len(self.employees) - 3)
+        self.assertEqual(Employee.all_objects.count(), len(self.employees) + 2)
+
+    def test_delete_cascades_to_children(self):
+        client = APIClient()
+        department, other = self.departments
+        response = client.delete(f"{reverse('department')}?rec_id={department.pk + 10000}")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Employee.objects.filter(department=department).exists())
+        self.assertTrue(Employee.all_objects.filter(department=department).exists())
+        self.assertTrue(Employee.objects.filter(department=other).exists())
+        # One UPDATE per model, children first, and one ModelVersion bump per changed model
+        department = Department.objects.create(name='Sales')
+        Employee.objects.create(name='Seller', department=department)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.delete(reverse('department'), {'rec_ids': [str(department.pk + 10000)]}, format='json')
+        self.assertEqual(response.data['count'], 1)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 4)
+        self.assertIn('employee', updates[0])
+        self.assertFalse(Employee.objects.filter(name='Seller').exists())
+
+    def test_delete_form_encoded_rec_ids(self):
+        rec_ids = [str(employee.pk + 10000) for employee in self.employees[:2]]
+        response = APIClient().delete(reverse('employee'), urlencode({'rec_ids': rec_ids}, doseq=True),
+                                      content_type='application/x-www-form-urlencoded')
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(Employee.objects.count(), len(self.employees) - 2)
+
+    def test_malformed_bulk_payloads_are_rejected(self):
+        client = APIClient()
+        rec_id = str(self.employees[0].pk + 10000)
+        response = client.delete(reverse('employee'), [rec_id], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data['form_error']), {'rec_ids'})
+        response = client.delete(reverse('employee'), {'rec_ids': rec_id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data['form_error']), {'rec_ids'})
+        response = client.put(reverse('employee'), [{'rec_id': rec_id, 'name': 'Renamed'}, rec_id, None],
+                              format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['form_error'], {'1': 'Expected an object', '2': 'Expected an object'})
+        self.assertEqual(Employee.objects.count(), len(self.employees))
+
+
+class ValidatorCheckRegistryTestCase(TestCase):
+
+    def test_registered_check_reports_message_and_code(self):
+        class Validator(DjangoSerializerValidator):
+            pass
+
+        @Validator.register_check('{field} must be upper case', code='upper_case')
+        def check_upper(validator, field, value):
+            return value is not None and value != value.upper()
+
+        validator = Validator(model=Employee, instance=None)
+        validator.set_attrs({'name': 'alice', 'department': None})
+        validator.check_upper('name')
+        validator.check_empty('department')
+        self.assertEqual(validator.custom_errors, {'name': ['Name must be upper case'],
+                                                   'department': ['Department is required']})
+        self.assertEqual(validator.custom_errors['name'][0].code, 'upper_case')
+        self.assertNotIn('check_upper', DjangoSerializerValidator.checks)
+
+    def test_check_exists_non_ascii(self):
+        # SQLite's LOWER() only folds ASCII, the posted value has to be lowered by it too
+        Department.objects.create(name='École')
+        response = APIClient().post(reverse('department'), {'name': 'École'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['form_error'], {'name': 'Name is already exists'})
+        response = APIClient().post(reverse('department'), {'name': 'ÉCOLE'}, format='json')
+        self.assertEqual(response.data['form_error'], {'name': 'Name is already exists'})
+
+
+class ResponseCacheTestCase(TestCase):
+
+    def setUp(self):
+        response_cache.clear()
+        create_departments(2)
+
+    def test_hits_and_related_invalidation(self):
+        client = APIClient()
+        params = {'action': 'get_data'}
+        self.assertEqual(client.get(reverse('department'), params)['X-Cache'], 'MISS')
+        # only the ModelVersion lookup for the ETag
+        with self.assertNumQueries(1):
+            response = client.get(reverse('department'), params)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        employee = Employee.objects.first()
+        employee.name = 'Renamed'
+        employee.save()
+        response = client.get(reverse('department'), params)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('Renamed', [row['name'] for department in response.data['data'] for row in department['employees']])
+        self.assertEqual(response_cache.stats()['hits'], 1)
+        self.assertEqual(response_cache.stats()['misses'], 2)
+
+    def test_bulk_delete_invalidates(self):
+        client = APIClient()
+        rows = client.get(reverse('employee'), {'action': 'get_data'}).data['data']
+        client.delete(reverse('employee'), {'rec_ids': [rows[0]['rec_id']]}, format='json')
+        response = client.get(reverse('employee'), {'action': 'get_data'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['data']), len(rows) - 1)
+
+    def test_write_in_another_process_invalidates(self):
+        # What import_rows/backfill_salts or another worker do: a write plus a ModelVersion bump, nothing in process
+        client = APIClient()
+        response = client.get(reverse('employee'), {'action': 'get_data'})
+        Employee.objects.update(name='Renamed')
+        ModelVersion.bump(Employee)
+        fresh = client.get(reverse('employee'), {'action': 'get_data'})
+        self.assertNotEqual(fresh['ETag'], response['ETag'])
+        self.assertEqual(fresh['X-Cache'], 'MISS')
+        self.assertEqual({row['name'] for row in fresh.data['data']}, {'Renamed'})
+
+    def test_queryset_delete_invalidates(self):
+        client = APIClient()
+        etag = client.get(reverse('employee'), {'action': 'get_data'})['ETag']
+        Employee.objects.filter(name='Employee 0.0').delete()
+        response = client.get(reverse('employee'), {'action': 'get_data'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertNotIn('Employee 0.0', [row['name'] for row in response.data['data']])
+        # Employees deleted by the CASCADE of their department bump the employee version too
+        etag = response['ETag']
+        Department.objects.filter(name='Department 1').delete()
+        response = client.get(reverse('employee'), {'action': 'get_data'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertFalse([row for row in response.data['data'] if row['name'].startswith('Employee 1.')])
+
+    def test_lru_and_ttl_eviction(self):
+        cache = ResponseCache(max_entries=2, timeout=60)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, {'data': key})
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('c'), {'data': 'c'})
+        cache.timeout = -1
+        cache.set('d', {'data': 'd'})
+        self.assertIsNone(cache.get('d'))
+
+
+class ConditionalGetTestCase(TestCase):
+
+    def test_etag_not_modified_until_a_change(self):
+        create_departments(2)
+        client = APIClient()
+        params = {'action': 'get_data'}
+        etag = client.get(reverse('department'), params)['ETag']
+        with self.assertNumQueries(1):
+            response = client.get(reverse('department'), params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(client.get(reverse('department'), {'action': 'get_data', 'page_size': 1},
+                                    HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        rec_id = client.get(reverse('employee'), params).data['data'][0]['rec_id']
+        client.delete(f"{reverse('employee')}?rec_id={rec_id}")
+        response = client.get(reverse('department'), params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Last-Modified', response)
+
+
+class AsyncViewTestCase(TransactionTestCase):
+
+    async def test_async_crud_matches_sync_view(self):
+        await sync_to_async(create_departments)(2)
+        client = AsyncClient()
+        url = reverse('async_employee')
+        department = await Department.objects.afirst()
+        response = await client.post(url, {'name': 'Async', 'department': str(department.pk + 10000)},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        rec_id = response.json()['success']['rec_id']
+        response = await client.post(url, {'name': 'Other', 'department': '1'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['form_error']), {'department'})
+        response = await client.post(url, {'name': 'async', 'department': str(department.pk + 10000)},
+                                     content_type='application/json')
+        self.assertEqual(response.json()['form_error'], {'name': 'Name is already exists'})
+        response = await client.put(f'{url}?rec_id={rec_id}',
+                                    {'name': 'Async renamed', 'department': str(department.pk + 10000)},
+                                    content_type='application/json')
+        self.assertEqual(response.json()['success']['name'], 'Async renamed')
+        response = await client.get(url, {'action': 'fetch_record', 'rec_id': rec_id})
+        self.assertEqual(response.json()['data']['department']['label'], department.name)
+        for name in ('async_employee', 'async_department'):
+            expected = await sync_to_async(APIClient().get)(reverse(name.replace('async_', '')), {'action': 'get_data'})
+            response = await client.get(reverse(name), {'action': 'get_data'})
+            self.assertEqual(response.json(), expected.json())
+            self.assertIn('ETag', response)
+        response = await client.delete(f'{url}?rec_id={rec_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(await Employee.objects.filter(name='Async renamed').aexists())
+
+
+class ErrorLogWriterTestCase(SimpleTestCase):
+
+    def test_batches_dedupes_and_rotates(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'error_log.txt')
+            writer = ErrorLogWriter(path, max_bytes=400, backup_count=2, dedupe_window=0.2, flush_interval=0.05)
+            for _ in range(5):
+                writer.log('Employee', 'Traceback A', latency=0.01)
+            writer.log('Employee', 'Traceback B')
+            writer.flush()
+            with open(path) as f:
+                content = f.read()
+            self.assertEqual(content.count('Traceback A'), 1)
+            self.assertIn('Latency: 10.0 ms', content)
+            time.sleep(0.3)
+            writer.log('Employee', 'x' * 300)
+            writer.flush()
+            with open(path) as f, open(f'{path}.1') as rotated:
+                content, rotated_content = f.read(), rotated.read()
+            self.assertIn('x' * 300, content)
+            self.assertIn('Traceback A', rotated_content)
+            self.assertIn('Repeated: 4 more times', content + rotated_content)
+
+
+class FormConfigsTestCase(TestCase):
+
+    def get_form_configs(self, url_name):
+        response = APIClient().get(reverse(url_name), {'get_form_configs': 'True'})
+        return response.data['form_configs']
+
+    def test_generated_from_serializers(self):
+        department = Department.objects.create(name='IT')
+        form_configs = self.get_form_configs('department')
+        self.assertEqual(form_configs['fields'], [
+            {'name': 'name', 'label': 'Name', 'type': 'text', 'rules': {'required': True, 'maxLength': 100}},
+        ])
+        self.assertEqual(form_configs['repeaters']['employees']['fields'], [
+            {'name': 'name', 'label': 'Name', 'type': 'text', 'rules': {'required': True, 'maxLength': 100}},
+        ])
+        department_field = self.get_form_configs('employee')['fields'][1]
+        self.assertEqual(department_field['type'], 'select')
+        self.assertEqual(department_field['options'], [{'value': str(department.pk + 10000), 'label': 'IT'}])
+
+    def test_options_cached_until_save(self):
+        Department.objects.create(name='IT')
+        form_fields = get_form_fields(EmployeeCreateUpdateSerializer)
+        # only the ModelVersion lookup of the options key
+        with self.assertNumQueries(1):
+            self.assertEqual(get_form_fields(EmployeeCreateUpdateSerializer), form_fields)
+        Department.objects.create(name='HR')
+        self.assertEqual([option['label'] for option in get_form_fields(EmployeeCreateUpdateSerializer)[1]['options']],
+                         ['IT', 'HR'])
+
+
+class SaltTestCase(TestCase):
+
+    def test_bulk_create_fills_salts(self):
+        department = Department.objects.create(name='IT')
+        employees = Employee.objects.bulk_create([Employee(name=f'Employee {i}', department=department)
+                                                  for i in range(5)] + [Employee(name='Kept', salt='kept')])
+        salts = [employee.salt for employee in employees]
+        self.assertEqual(salts[-1], 'kept')
+        self.assertEqual(len(set(salts)), 6)
+        self.assertTrue(all(len(salt) == 32 for salt in salts[:-1]))
+        self.assertEqual(len(department.salt), 32)
+
+    def test_backfill_salts(self):
+        department = Department.objects.create(name='IT')
+        Employee.all_objects.bulk_create([Employee(name=f'Employee {i}', department=department, is_del=i % 2 == 0)
+                                          for i in range(5)])
+        Employee.all_objects.update(salt=None)
+        call_command('backfill_salts', 'employee', chunk_size=2, stdout=open(os.devnull, 'w'))
+        salts = list(Employee.all_objects.values_list('salt', flat=True))
+        self.assertEqual(len(set(salts)), 5)
+        self.assertTrue(all(salt and len(salt) == 32 for salt in salts))
+
+
+class RecIdCodecTestCase(TestCase):
+
+    def test_batch_encode_decode(self):
+        codec = RecIdCodec(offset=500)
+        self.assertEqual(codec.encode_many([1, 2]), ['501', '502'])
+        self.assertEqual(codec.decode_many(['501', 'x', None]), [1, None, None])
+
+    def test_decode_payload(self):
+        codec = RecIdCodec()
+        relation_fields = (('department', FOREIGN_KEY_FIELD), ('tags', MANY_TO_MANY_FIELD))
+        data = codec.decode_payload({'name': 'A', 'department': '10001', 'tags': ['10002', 'x']}, relation_fields)
+        self.assertEqual(data, {'name': 'A', 'department': 1, 'tags': [2, 'x']})
+        query_dict = codec.decode_payload(QueryDict('department=10003&tags=10004&tags=10005'), relation_fields)
+        self.assertEqual((query_dict['department'], query_dict.getlist('tags')), (3, [4, 5]))
+
+    def test_malformed_related_rec_id_is_a_validation_error(self):
+        response = APIClient().post(reverse('employee'), {'name': 'A', 'department': 'x'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ValuesFastPathTestCase(TestCase):
+
+    def test_same_shape_as_serializer(self):
+        create_departments(2)
+        Employee.objects.create(name='No department')
+        queryset = Employee.objects.order_by('pk')
+        plan = get_values_plan(EmployeeListRetrieveSerializer)
+        self.assertEqual(list(iter_values_representation(queryset, plan)),
+                         EmployeeListRetrieveSerializer(queryset.select_related('department'), many=True).data)
+
+    def test_nested_serializer_falls_back(self):
+        self.assertIsNone(get_values_plan(DepartmentListRetrieveSerializer))
+
+    def test_get_data_reads_values(self):
+        create_departments(2)
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().get(reverse('employee'), {'action': 'get_data'})
+        self.assertEqual(len(response.data['data']), 6)
+        self.assertIn('"App_Model_Serializer_department"."salt"', queries[-1]['sql'])
+
+
+class RelatedStubMemoTestCase(TestCase):
+
+    def test_nested_rows_reuse_parent_stub(self):
+        create_departments(2)
+        with CaptureQueriesContext(connection) as queries:
+            data = APIClient().get(reverse('department'), {'action': 'get_data'}).data['data']
+        self.assertNotIn('JOIN', queries[-1]['sql'])
+        for department in data:
+            stubs = [employee['department'] for employee in department['employees']]
+            self.assertEqual(stubs[0], {'value': department['rec_id'], 'salt': department['salt'],
+                                        'label': department['name']})
+            self.assertTrue(all(stub is stubs[0] for stub in stubs))
+
+    def test_stub_rendered_once_per_related_instance(self):
+        create_departments(1)
+        employees = list(Employee.objects.select_related('department'))
+        data = EmployeeListRetrieveSerializer(employees, many=True).data
+        self.assertIs(data[0]['department'], data[1]['department'])
+
+
+class MetricsTestCase(TestCase):
+
+    def setUp(self):
+        metrics_registry.clear()
+
+    def test_duplicate_queries(self):
+        metrics = RequestMetrics()
+        token = _request_metrics.set(metrics)
+        try:
+            for pk in (1, 2, 3):
+                list(Employee.objects.filter(pk=pk))
+            list(Department.objects.all())
+        finally:
+            _request_metrics.reset(token)
+        self.assertEqual((metrics.queries, metrics.duplicate_queries), (4, 2))
+
+    def test_server_timing_and_endpoint(self):
+        create_departments(2)
+        client = APIClient()
+        response = client.get(reverse('department'), {'action': 'get_data'})
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="3 queries, 0 duplicate", '
+                                                    r'serializer;dur=[\d.]+;desc="2 rows", total;dur=[\d.]+')
+        # Answered from the response cache, nothing serialized
+        client.get(reverse('department'), {'action': 'get_data'})
+        self.assertNotIn('Server-Timing', client.get(reverse('metrics')))
+        entry, = client.get(reverse('metrics')).data['data']
+        self.assertEqual((entry['view'], entry['action'], entry['requests'], entry['rows']),
+                         ('DepartmentView', 'get_data', 2, 2))
+        self.assertEqual(entry['total_ms']['count'], 2)
+        self.assertIsNotNone(entry['total_ms']['p99'])
+
+    def test_unknown_actions_share_one_entry(self):
+        client = APIClient()
+        for i in range(5):
+            client.get(reverse('employee'), {'action': f'junk{i}'})
+        entry, = client.get(reverse('metrics')).data['data']
+        self.assertEqual((entry['view'], entry['action'], entry['requests']), ('EmployeeView', 'other', 5))
+
+
+class BenchmarkBaselineTestCase(SimpleTestCase):
+
+    def test_compare_results(self):
+        baseline = [{'view': 'EmployeeView', 'scenario': 'get_data', 'rows': 100, 'requests_per_sec': 100.0,
+                     'p50_ms': 10.0, 'queries': 2, 'peak_kb': 50.0}]
+        results = [{**baseline[0], 'requests_per_sec': 85.0, 'p50_ms': 11.0, 'queries': 3, 'rows': 200},
+                   {**baseline[0], 'scenario': 'fetch_record'}]
+        regressions = compare_results(results, baseline, tolerance=0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('queries: 2 -> 3', regressions[0])
+
+
+class MyAdminTestCase(TestCase):
+
+    def setUp(self):
+        count_cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+
+    def get_changelist(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:App_Model_Serializer_employee_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries]
+
+    def test_department_select_related(self):
+        create_departments(2)
+        queries = self.get_changelist()
+        create_departments(5)
+        count_cache.clear()
+        self.assertEqual(len(self.get_changelist()), len(queries))
+
+    def test_counts_and_facets_cached(self):
+        create_departments(2)
+        self.assertTrue(any('COUNT(' in sql for sql in self.get_changelist(_facets='True')))
+        self.assertFalse(any('COUNT(' in sql for sql in self.get_changelist(_facets='True')))
+
+    def test_estimate_count(self):
+        create_departments(2)
+        queryset = Employee.all_objects.all()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimate_count(queryset), 8)
+        self.assertIsNone(estimate_count(queryset.filter(is_del=False)))
+
+
+class ImportTestCase(TestCase):
+
+    def test_upload_csv(self):
+        department = Department.objects.create(name='IT')
+        Employee.objects.create(name='Existing', department=department)
+        rec_id = str(department.pk + 10000)
+        content = f'name,department\nAnn,{rec_id}\nexisting,{rec_id}\nBob,\nann,{rec_id}\nCid,99999\nDan,{rec_id}\n'
+        upload = SimpleUploadedFile('employees.csv', content.encode())
+        # Savepoint, FK in_bulk, LOWER() of the names, LOWER(name) IN, INSERT, ModelVersion bump, release
+        with self.assertNumQueries(7):
+            response = APIClient().post(f"{reverse('employee')}?action=import", {'file': upload})
+        result = response.data['success']
+        self.assertEqual((result['rows'], result['created']), (6, 2))
+        self.assertEqual([(error['row'], sorted(error['errors'])) for error in result['errors']],
+                         [(2, ['name']), (3, ['department']), (4, ['name']), (5, ['department'])])
+        self.assertEqual(result['error_count'], 4)
+        self.assertEqual(sorted(Employee.objects.values_list('name', flat=True)), ['Ann', 'Dan', 'Existing'])
+        self.assertTrue(all(Employee.objects.values_list('salt', flat=True)))
+
+    def test_upload_error_report_is_capped(self):
+        content = 'name,department\n' + ''.join(f'Employee {i},1\n' for i in range(5))
+        upload = SimpleUploadedFile('employees.csv', content.encode())
+        with mock.patch.object(EmployeeView, 'import_error_limit', 2):
+            response = APIClient().post(f"{reverse('employee')}?action=import", {'file': upload})
+        result = response.data['success']
+        self.assertEqual((result['rows'], result['created'], result['error_count']), (5, 0, 5))
+        self.assertEqual([error['row'] for error in result['errors']], [1, 2])
+
+    def test_command_resumes_from_checkpoint(self):
+        Department.objects.create(name='IT')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'departments.ndjson')
+            checkpoint = os.path.join(directory, 'checkpoint.json')
+            errors = os.path.join(directory, 'errors.ndjson')
+            with open(path, 'w') as f:
+                f.write('{"name": "HR"}\n{"name": "it"}\nnot json\n\n{"name": "Sales"}\n')
+            with open(checkpoint, 'w') as f:
+                json.dump({'row': 1, 'created': 1, 'errors': 0}, f)
+            call_command('import_rows', 'department', path, chunk_size=2, checkpoint=checkpoint, errors=errors,
+                         stdout=open(os.devnull, 'w'))
+            with open(checkpoint) as f:
+                self.assertEqual(json.load(f), {'row': 5, 'created': 2, 'errors': 2})
+            with open(errors) as f:
+                self.assertEqual([json.loads(line)['row'] for line in f], [2, 3])
+        self.assertEqual(sorted(Department.objects.values_list('name', flat=True)), ['IT', 'Sales'])
+
+
+class ExportTestCase(TestCase):
+
+    def test_parts_match_get_data(self):
+        create_departments(3)
+        Employee.objects.create(name='No department')
+        for url_name, view_path in (('employee', 'App_Model_Serializer.views.EmployeeView'),
+                                    ('department', 'App_Model_Serializer.views.DepartmentView')):
+            data = APIClient().get(reverse(url_name), {'action': 'get_data'}).data['data']
+            with tempfile.TemporaryDirectory() as directory:
+                manifest = export_view(view_path, directory, workers=1, parts=3, concatenate=False)
+                rows = []
+                for part in manifest['parts']:
+                    with open(os.path.join(directory, part['path'])) as f:
+                        rows += [json.loads(line) for line in f]
+            self.assertEqual(len(manifest['parts']), 3)
+            self.assertEqual(rows, json.loads(json.dumps(data)))
+
+    def test_csv_download(self):
+        create_departments(1)
+        with mock.patch('App_Model_Serializer.exports.ProcessPoolExecutor') as pool:
+            response = APIClient().get(reverse('employee'), {'action': 'export', 'file_format': 'csv'})
+        pool.assert_not_called()
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'name,department.value,department.salt,department.label,rec_id,salt')
+        self.assertEqual(len(lines), 4)
+
+
+class RendererTestCase(TestCase):
+
+    def test_matches_json_renderer(self):
+        create_departments(2)
+        data = APIClient().get(reverse('department'), {'action': 'get_data', 'get_form_configs': 'True'}).data
+        for response in (data, {'success': {'name': 'Caf\u00e9\u2028\u2029', 'updated_at': timezone.now(),
+                                            'amount': Decimal('1.50'), 'label': gettext_lazy('Name')}},
+                         {1: 'int key'}, ['not', 'a', 'dict']):
+            expected = JSONRenderer().render(response)
+            self.assertEqual(CRUDJSONRenderer().render(response), expected)
+            with mock.patch.object(renderers, 'orjson', None):
+                self.assertEqual(CRUDJSONRenderer().render(response), expected)
+
+    def test_views_render_with_it(self):
+        create_departments(1)
+        response = APIClient().get(reverse('employee'), {'action': 'get_data'})
+        self.assertIsInstance(response.accepted_renderer, CRUDJSONRenderer)
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+
+class SparseFieldsetTestCase(TestCase):
+
+    def test_pruned_fields_are_not_read(self):
+        create_departments(2)
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().get(reverse('employee'), {'action': 'get_data', 'fields': 'name'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['data'][0]), {'name', 'rec_id'})
+        self.assertNotIn('JOIN', queries[-1]['sql'])
+        self.assertNotIn('salt', queries[-1]['sql'])
+        full = APIClient().get(reverse('employee'), {'action': 'get_data'}).data['data']
+        self.assertEqual(full[0]['name'], 'Employee 0.0')
+        self.assertIn('department', full[0])
+
+    def test_nested_fields(self):
+        create_departments(2)
+        client = APIClient()
+        with CaptureQueriesContext(connection) as queries:
+            data = client.get(reverse('department'), {'action': 'get_data', 'fields': 'name,employees',
+                                                      'employees.fields': 'name'}).data['data']
+        self.assertEqual(set(data[0]), {'name', 'employees', 'rec_id'})
+        self.assertEqual([set(employee) for employee in data[0]['employees']], [{'name', 'rec_id'}] * 3)
+        self.assertNotIn('"App_Model_Serializer_employee"."salt"', queries[-1]['sql'])
+        # The parent salt is deferred, nothing renders the parent stub so nothing loads it row by row
+        self.assertEqual(len([query for query in queries if 'App_Model_Serializer_department' in query['sql']
+                              or 'App_Model_Serializer_employee' in query['sql']]), 2)
+        with CaptureQueriesContext(connection) as queries:
+            data = client.get(reverse('department'), {'action': 'get_data', 'fields': 'name'}).data['data']
+        self.assertEqual(set(data[0]), {'name', 'rec_id'})
+        self.assertFalse(any('App_Model_Serializer_employee' in query['sql'] for query in queries))
+
+    def test_every_field_matches_full_response(self):
+        create_departments(2)
+        client = APIClient()
+        for url_name, fields in (('employee', 'name,department,salt'), ('department', 'name,employees,salt')):
+            self.assertEqual(client.get(reverse(url_name), {'action': 'get_data', 'fields': fields}).data['data'],
+                             client.get(reverse(url_name), {'action': 'get_data'}).data['data'])
+
+    def test_unknown_fields(self):
+        for params in ({'fields': 'name,nope'}, {'employees.fields': 'name'}):
+            response = APIClient().get(reverse('employee'), {'action': 'get_data', **params})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(set(response.json()['form_error']), set(params))
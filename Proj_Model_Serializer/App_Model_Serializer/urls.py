@@ -6,4 +6,7 @@ from . import views
 urlpatterns = [
     path('employee/', views.EmployeeView.as_view(), name='employee'),
     path('department/', views.DepartmentView.as_view(), name='department'),
+    path('async/employee/', views.AsyncEmployeeView.as_view(), name='async_employee'),
+    path('async/department/', views.AsyncDepartmentView.as_view(), name='async_department'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
 ]
@@ -1,11 +1,132 @@
+import atexit
 import datetime
+import os
+import queue
+import threading
+import time
 import traceback
 
+from django.conf import settings
 from rest_framework import status
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.response import Response
 
 
+class ErrorLogWriter:
+    """
+    Error log written by a background thread, the request only formats the traceback and enqueues it.
+    The queue is bounded, records beyond it are counted in dropped instead of blocking the request.
+    Records are written in batches, the file is rotated by size and identical tracebacks of a module
+    within dedupe_window seconds are written once, followed by a line counting the repeats.
+    """
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=5, queue_size=10000, batch_size=100,
+                 dedupe_window=60, flush_interval=1.0):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.dedupe_window = dedupe_window
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.seen = dict()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def log(self, module_name, trace, latency=None):
+        self.start()
+        try:
+            self.queue.put_nowait((datetime.datetime.now(), module_name, trace, latency))
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='ErrorLogWriter', daemon=True)
+                self.thread.start()
+
+    def flush(self, timeout=5):
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def run(self):
+        while True:
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                lines = self.format_batch(batch) + self.expire_repeats()
+                if lines:
+                    self.write(''.join(lines))
+            except OSError:
+                pass
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def format_repeats(self, module_name, timestamp, repeats):
+        return f'TimeStamp: {datetime.datetime.now()}\nModule: {module_name}\n' \
+               f'Repeated: {repeats} more times since {timestamp}\n\n'
+
+    def format_batch(self, batch):
+        lines = []
+        now = time.monotonic()
+        for timestamp, module_name, trace, latency in batch:
+            key = (module_name, trace)
+            seen = self.seen.get(key, None)
+            if seen is not None and now - seen[0] < self.dedupe_window:
+                seen[1] += 1
+                continue
+            if seen is not None and seen[1]:
+                lines.append(self.format_repeats(module_name, seen[2], seen[1]))
+            self.seen[key] = [now, 0, timestamp]
+            lines.append(f'TimeStamp: {timestamp}\nModule: {module_name}\n')
+            if latency is not None:
+                lines.append(f'Latency: {latency * 1000:.1f} ms\n')
+            lines.append(f'Traceback: {trace}\n\n')
+        return lines
+
+    def expire_repeats(self):
+        lines = []
+        now = time.monotonic()
+        for key, (first_seen, repeats, timestamp) in list(self.seen.items()):
+            if now - first_seen >= self.dedupe_window:
+                del self.seen[key]
+                if repeats:
+                    lines.append(self.format_repeats(key[0], timestamp, repeats))
+        return lines
+
+    def write(self, text):
+        data = text.encode()
+        if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+            self.rotate()
+        with open(self.path, 'ab') as f:
+            f.write(data)
+
+    def rotate(self):
+        if not self.backup_count:
+            os.remove(self.path)
+            return
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f'{self.path}.{i}'):
+                os.replace(f'{self.path}.{i}', f'{self.path}.{i + 1}')
+        os.replace(self.path, f'{self.path}.1')
+
+
+ERROR_LOG = getattr(settings, 'ERROR_LOG', {'PATH': 'error_log.txt'})
+error_log = ErrorLogWriter(**{k.lower(): v for k, v in ERROR_LOG.items()})
+atexit.register(error_log.flush)
+
+
 def custom_exception_handler(exc, context):
     if isinstance(exc, PermissionDenied):
         return Response({'error': 'Permission Denied'}, status=status.HTTP_403_FORBIDDEN)
@@ -14,29 +135,10 @@ def custom_exception_handler(exc, context):
         form_error = {k: ', '.join(v) if isinstance(v, list) else v for k, v in exc.detail.items()}
         return Response({'form_error': form_error}, status=status.HTTP_400_BAD_REQUEST)
 
-    with open('error_log.txt', 'a') as f:
-        f.write(f'TimeStamp: {datetime.datetime.now()}\n')
-        if 'view' in context:
-            module_name = getattr(context['view'], 'module_name', 'Create New Module')
-            f.write(f'Module: {module_name}\n')
-        f.write(f'Traceback: {traceback.format_exc()}\n\n')
-        f.close()
+    view = context.get('view', None)
+    started_at = getattr(view, 'started_at', None)
+    error_log.log(module_name=getattr(view, 'module_name', 'Create New Module'), trace=traceback.format_exc(),
+                  latency=time.perf_counter() - started_at if started_at is not None else None)
 
     return Response({'error': 'Something Went Wrong'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-
-def get_test_post_data():
-    return {
-        'name': 'IT',
-        'employees': [
-            {
-                'name': '100021',
-            },
-            {
-                'name': '100022',
-            },
-            {
-                'name': '100023',
-            },
-        ]
-    }
@@ -1,15 +1,38 @@
+import asyncio
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from itertools import islice
+
+from asgiref.sync import sync_to_async
 from django.core.exceptions import ImproperlyConfigured
 from django.db import transaction
+from django.db.models import Q
+from django.http import FileResponse, QueryDict, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.generics import GenericAPIView
-from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.views import APIView
 from rest_framework.response import Response
 
-from .models import Employee, Department
+from .cache import response_cache
+from .exports import EXPORT_FORMATS, export_view
+from .form_configs import build_form_configs
+from .imports import get_import_format, read_rows, import_rows
+from .metrics import get_request_metrics, metrics_registry
+from .models import Employee, Department, ModelVersion
+from .query_plan import get_query_plan, apply_query_plan, get_query_plan_models, get_values_plan, \
+    iter_values_representation, aiter_values_representation
+from .rec_id import rec_id_codec
+from .renderers import dumps
 from .serializer import EmployeeListRetrieveSerializer, EmployeeCreateUpdateSerializer, \
-    DepartmentListRetrieveSerializer, DepartmentCreateUpdateSerializer
-from .utils import get_test_post_data
+    DepartmentListRetrieveSerializer, DepartmentCreateUpdateSerializer, DjangoBatchSerializerValidator, \
+    get_relation_fields, get_related_pks, get_related_instances, get_sparse_serializer_class
 
 
 class GenericAPICRUDView(GenericAPIView):
@@ -17,37 +40,178 @@ class GenericAPICRUDView(GenericAPIView):
     form_configs = None
     list_serializer_class = None
     module_name = 'Create New Module'
+    stream_data = False
+    stream_chunk_size = 2000
+    page_size = None
+    max_page_size = 1000
+    cursor_ordering = 'pk'
+    repeater_bulk_create = False
+    repeater_batch_size = 500
+    response_cache = None
+    conditional_get = True
+    values_fast_path = False
+    import_chunk_size = 1000
+    import_error_limit = 100
+    export_workers = 1
+    metrics_get_actions = ('get_data', 'fetch_record', 'export')
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.model is None:
             raise ImproperlyConfigured(f"Attribute 'model' missing in {self.__class__.__name__}")
 
+    def initial(self, request, *args, **kwargs):
+        self.started_at = time.perf_counter()
+        super().initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        metrics = get_request_metrics()
+        if metrics is not None:
+            metrics.view = self.__class__.__name__
+            metrics.action = self.get_metrics_action()
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def get_metrics_action(self):
+        """Registry key of the request, ?action= values outside metrics_get_actions all count as 'other'"""
+        method = self.request.method
+        if method == 'GET':
+            action = self.request.GET.get('action', None)
+            if not action:
+                return 'get_form_configs' if self.request.GET else 'get'
+            return action if action in self.metrics_get_actions else 'other'
+        if method == 'POST' and self.request.GET.get('action', None) == 'import':
+            return 'import'
+        if method == 'POST':
+            return 'repeater_save' if hasattr(self, 'repeaters') and hasattr(self, 'repeater_instance_key') \
+                else 'create'
+        if method == 'PUT':
+            return 'bulk_update' if isinstance(self.request.data, list) else 'update'
+        if method == 'DELETE':
+            try:
+                return 'bulk_delete' if self.get_bulk_rec_ids() is not None else 'delete'
+            except ValidationError:
+                return 'bulk_delete'
+        return method.lower()
+
+    def get_fieldsets(self):
+        """{path: field names} of ?fields=name,rec_id (path '') and ?employees.fields=name (nested serializers)"""
+        request = getattr(self, 'request', None)
+        if request is None:
+            return dict()
+        fieldsets = dict()
+        for k, v in request.GET.items():
+            if k == 'fields' or k.endswith('.fields'):
+                path = '' if k == 'fields' else k[:-len('.fields')]
+                fieldsets[path] = [name.strip() for name in v.split(',') if name.strip()]
+        return fieldsets
+
+    def get_list_serializer_class(self):
+        """list_serializer_class, or serializer_class, pruned to the sparse fieldsets of the request"""
+        serializer_class = self.list_serializer_class or self.get_serializer_class()
+        fieldsets = self.get_fieldsets()
+        return get_sparse_serializer_class(serializer_class, fieldsets) if fieldsets else serializer_class
+
     def get_list_serializer(self, *args, **kwargs):
-        if self.list_serializer_class:
-            return self.list_serializer_class(*args, **kwargs)
-        return self.get_serializer(*args, **kwargs)
+        if not self.list_serializer_class:
+            # As get_serializer() does
+            kwargs.setdefault('context', self.get_serializer_context())
+        return self.get_list_serializer_class()(*args, **kwargs)
     
     def get_form_configs(self):
-        return self.form_configs
+        """form_configs when set, otherwise generated from the create/update serializer and repeaters"""
+        if self.form_configs is not None:
+            return self.form_configs
+        return build_form_configs(self.get_serializer_class(), getattr(self, 'repeaters', None),
+                                  getattr(self, 'repeater_instance_key', None))
 
     def get_post_data(self, post_data=None, serializer_class=None):
-        post_data = post_data or self.request.data
+        """Copy of the payload with FK/M2M rec_ids decoded to pks"""
+        return self.get_rows_post_data([post_data or self.request.data], serializer_class)[0]
+
+    def get_rows_post_data(self, rows, serializer_class=None):
         serializer_class = serializer_class or self.get_serializer_class()
-        post_data = post_data.copy()
-        for k, v in serializer_class().get_fields().items():
-            if k in post_data and post_data[k] and isinstance(v, PrimaryKeyRelatedField):
-                post_data[k] = int(post_data[k]) - 10000
-        return post_data
+        relation_fields = [(k, kind) for k, kind, queryset in get_relation_fields(serializer_class)]
+        return rec_id_codec.decode_rows(rows, relation_fields)
     
     def get_object_lookup_kwargs(self):
-        return {'pk': int(self.request.GET['rec_id']) - 10000}
+        return {'pk': rec_id_codec.decode(self.request.GET['rec_id'])}
+
+    def get_bulk_rec_ids(self):
+        """
+        rec_ids of a bulk delete, None for a single one: a JSON {"rec_ids": [...]}, repeated form fields
+        (rec_ids=10002&rec_ids=10003) or a comma separated query. Any other body is a ValidationError.
+        """
+        data = self.request.data
+        if isinstance(data, QueryDict):
+            rec_ids = data.getlist('rec_ids') or None
+        elif isinstance(data, dict):
+            rec_ids = data.get('rec_ids', None)
+        elif data:
+            raise ValidationError({'rec_ids': ['Expected an object with a list of rec_ids']})
+        else:
+            rec_ids = None
+        if rec_ids is not None and not isinstance(rec_ids, list):
+            raise ValidationError({'rec_ids': ['Expected a list of rec_ids']})
+        if rec_ids is None and self.request.GET.get('rec_ids', None):
+            rec_ids = self.request.GET['rec_ids'].split(',')
+        return rec_ids
+
+    def get_related_pks(self, serializer_class, rows):
+        return get_related_pks(serializer_class, rows)
+
+    def get_related_instances(self, serializer_class, rows):
+        return get_related_instances(serializer_class, rows)
     
     def get_queryset(self):
         return self.model.objects.all()
 
-    def get_object(self):
-        return self.get_queryset().get(**self.get_object_lookup_kwargs())
+    def get_list_queryset(self):
+        """get_queryset with select_related/prefetch_related worked out from the list serializer fields"""
+        return apply_query_plan(self.get_queryset(), get_query_plan(self.get_list_serializer_class()))
+
+    def get_values_plan(self):
+        """values_list plan of the list serializer when values_fast_path is set and its fields are plain columns/FKs"""
+        if not self.values_fast_path:
+            return None
+        return get_values_plan(self.get_list_serializer_class())
+
+    def get_list_data(self):
+        """get_data rows, read with values_list without model instances when get_values_plan allows it"""
+        values_plan = self.get_values_plan()
+        if values_plan is None:
+            return self.get_list_serializer(self.get_list_queryset(), many=True).data
+        return list(iter_values_representation(self.get_queryset(), values_plan))
+
+    def get_read_models(self):
+        return get_query_plan_models(self.model, get_query_plan(self.get_list_serializer_class()))
+
+    def get_read_key_parts(self):
+        serializer_class = self.get_list_serializer_class()
+        return (self.__class__.__module__, self.__class__.__qualname__, serializer_class.__qualname__,
+                sorted(self.request.GET.lists()))
+
+    def get_cache_key(self, versions):
+        """Keyed on the ModelVersions of get_conditional_headers, cached responses and ETags change together"""
+        return self.response_cache.make_key(self.get_read_key_parts(), versions)
+
+    def get_conditional_headers(self, versions=None):
+        """ETag/Last-Modified from the ModelVersion of every model the response reads, one query"""
+        if versions is None:
+            versions = ModelVersion.get_versions(self.get_read_models())
+        etag = hashlib.md5(repr((self.get_read_key_parts(), sorted(versions.items()))).encode()).hexdigest()
+        headers = {'ETag': f'"{etag}"'}
+        updated_at = [updated_at for version, updated_at in versions.values() if updated_at is not None]
+        if updated_at:
+            headers['Last-Modified'] = http_date(max(updated_at).timestamp())
+        return headers
+
+    def model_changed(self, model):
+        """Writes that bypass MyModel.save and MyQuerySet.update/delete (bulk_create)"""
+        ModelVersion.bump(model)
+
+    def get_object(self, queryset=None):
+        queryset = self.get_queryset() if queryset is None else queryset
+        return queryset.get(**self.get_object_lookup_kwargs())
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -56,6 +220,88 @@ class GenericAPICRUDView(GenericAPIView):
             context['is_form'] = True
         return context
 
+    def is_streaming(self):
+        return self.stream_data or self.request.GET.get('stream', False) == 'True'
+
+    def stream_list_data(self, queryset):
+        """
+        Yields the {"data": [...]} envelope of get_data one chunk of rows at a time.
+        Rows are read with .iterator(chunk_size), prefetches run per chunk, so memory stays bounded.
+        The related stub memo of the serializers is cleared per chunk for the same reason.
+        """
+        child = self.get_list_serializer(many=True).child
+        rows = queryset.iterator(chunk_size=self.stream_chunk_size)
+        separator = b''
+        yield b'{"data":['
+        while chunk := list(islice(rows, self.stream_chunk_size)):
+            child.context.pop('related_stubs', None)
+            yield separator + b','.join(dumps(child.to_representation(row)) for row in chunk)
+            separator = b','
+        yield b']}'
+
+    def get_page_size(self):
+        """page_size param or attribute capped at max_page_size, None when unset. Not a positive int: a 400"""
+        page_size = self.request.GET.get('page_size', self.page_size)
+        if not page_size:
+            return None
+        try:
+            page_size = int(page_size)
+        except (TypeError, ValueError):
+            page_size = 0
+        if page_size < 1:
+            raise ValidationError({'page_size': ['A positive integer is required']})
+        return min(page_size, self.max_page_size)
+
+    def get_cursor_keys(self, reverse=False):
+        field = self.cursor_ordering.lstrip('-')
+        descending = self.cursor_ordering.startswith('-') != reverse
+        keys = ['pk'] if field in ('pk', 'id') else [field, 'pk']
+        return keys, 'lt' if descending else 'gt'
+
+    def get_cursor_filter(self, cursor, reverse=False):
+        """
+        Cursors are rec_ids of the boundary row, other ordering columns are tie broken on pk.
+        A malformed cursor, or one of a row that is gone when the ordering column has to be read, is a 400.
+        """
+        keys, op = self.get_cursor_keys(reverse)
+        param = 'before' if reverse else 'after'
+        pk = rec_id_codec.decode_or_none(cursor)
+        if pk is None:
+            raise ValidationError({param: ['Invalid cursor']})
+        if len(keys) == 1:
+            return Q(**{f'pk__{op}': pk})
+        field = keys[0]
+        try:
+            value = self.model._base_manager.values_list(field, flat=True).get(pk=pk)
+        except self.model.DoesNotExist:
+            raise ValidationError({param: ['Record not found']})
+        return Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'pk__{op}': pk})
+
+    def paginate_list_data(self, queryset, page_size):
+        """
+        Keyset pagination over cursor_ordering, the page is found with an indexed range filter instead of OFFSET,
+        so deep pages cost the same as the first one.
+        after: rec_id, rows following it, before: rec_id, rows preceding it
+        """
+        after, before = self.request.GET.get('after', None), self.request.GET.get('before', None)
+        reverse = bool(before)
+        cursor = before or after
+        if cursor:
+            queryset = queryset.filter(self.get_cursor_filter(cursor, reverse))
+        keys, op = self.get_cursor_keys(reverse)
+        rows = list(queryset.order_by(*[f'-{k}' if op == 'lt' else k for k in keys])[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+        first = rec_id_codec.encode(rows[0].pk) if rows else before
+        last = rec_id_codec.encode(rows[-1].pk) if rows else after
+        return {
+            'data': self.get_list_serializer(rows, many=True).data,
+            'next': last if (reverse or has_more) else None,
+            'prev': first if (has_more if reverse else bool(after)) else None,
+        }
+
     def get(self, request, *args, **kwargs):
         """
         Allowed Cases to Call this method
@@ -63,49 +309,217 @@ class GenericAPICRUDView(GenericAPIView):
         2. Retrieving Single Object for Displaying Data, action: fetch_record
         3. Retrieving Single Object for Editing Form, action: fetch_record, is_form: True
         4. Getting Form Configuration for React Hook Form, get_form_configs: True
+        Listing is paginated by cursor when page_size is set or passed (after/before: rec_id),
+        otherwise written as a StreamingHttpResponse when stream_data is set or stream: True is passed.
+        Responses are cached in response_cache when set, keyed on the query params and the ModelVersions read.
+        get_data and fetch_record carry ETag/Last-Modified, If-None-Match/If-Modified-Since are answered with 304
         """
         action = request.GET.get('action', None)
+        if action == 'export':
+            return self.export_file()
+        headers, versions = dict(), None
+        if self.conditional_get and action in ('get_data', 'fetch_record'):
+            versions = ModelVersion.get_versions(self.get_read_models())
+            headers = self.get_conditional_headers(versions)
+            not_modified = self.get_not_modified_response(headers)
+            if not_modified is not None:
+                return not_modified
+        if action == 'get_data' and not self.get_page_size() and self.is_streaming():
+            return StreamingHttpResponse(self.stream_list_data(self.get_list_queryset()),
+                                         content_type='application/json', headers=headers)
+        if self.response_cache is None:
+            return Response(self.get_response_data(action), status=status.HTTP_200_OK, headers=headers)
+        if versions is None:
+            versions = ModelVersion.get_versions(self.get_read_models())
+        key = self.get_cache_key(versions)
+        response = self.response_cache.get(key)
+        headers['X-Cache'] = 'HIT'
+        if response is None:
+            response = self.response_cache.set(key, self.get_response_data(action))
+            headers['X-Cache'] = 'MISS'
+        return Response(response, status=status.HTTP_200_OK, headers=headers)
+
+    def export_file(self):
+        """
+        action: export, every live row as an NDJSON/CSV attachment (file_format: ndjson/csv) in the get_data
+        row shape, written over pk ranges by export_workers processes. It is 1, the request process itself:
+        a pool spawned per request costs more than it saves, large exports go through the export_rows command.
+        """
+        export_format = self.request.GET.get('file_format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'file_format': [f'One of {", ".join(EXPORT_FORMATS)}']})
+        directory = tempfile.mkdtemp()
+        try:
+            manifest = export_view(f'{self.__class__.__module__}.{self.__class__.__qualname__}', directory,
+                                   export_format, workers=self.export_workers)
+            f = open(os.path.join(directory, manifest['path']), 'rb')
+        finally:
+            # The open export file stays readable until the response closes it
+            shutil.rmtree(directory, ignore_errors=True)
+        filename = f'{self.model._meta.model_name}.{export_format}'
+        return FileResponse(f, as_attachment=True, filename=filename,
+                            content_type='text/csv' if export_format == 'csv' else 'application/x-ndjson')
+
+    def get_not_modified_response(self, headers):
+        last_modified = headers.get('Last-Modified', None)
+        not_modified = get_conditional_response(
+            self.request, etag=headers['ETag'],
+            last_modified=parse_http_date_safe(last_modified) if last_modified else None)
+        if not_modified is not None:
+            for k, v in headers.items():
+                not_modified[k] = v
+        return not_modified
+
+    def get_response_data(self, action):
+        page_size = self.get_page_size() if action == 'get_data' else None
+        if page_size:
+            return self.paginate_list_data(self.get_list_queryset(), page_size)
         response = {'data': None}
         if action == 'get_data':
-            response['data'] = self.get_list_serializer(self.get_queryset(), many=True).data
+            response['data'] = self.get_list_data()
         if action == 'fetch_record':
-            response['data'] = self.get_list_serializer(self.get_object()).data
-        if request.GET.get('get_form_configs', False) is True:
+            response['data'] = self.get_list_serializer(self.get_object(self.get_list_queryset())).data
+        if self.request.GET.get('get_form_configs', False) == 'True':
             response['form_configs'] = self.get_form_configs()
-        return Response(response, status=status.HTTP_200_OK)
+        return response
 
     def post(self, request, *args, **kwargs):
+        if request.GET.get('action', None) == 'import':
+            return self.import_file()
         if hasattr(self, 'repeaters') and hasattr(self, 'repeater_instance_key'):
-            try:
-                with transaction.atomic():
-                    form_errors = dict()
-                    data = get_test_post_data()
-                    repeater_data = dict()
-                    for repeater in self.repeaters:
-                        repeater_data[repeater] = data.pop(repeater, [])
-                    s = self.get_serializer(data=self.get_post_data(post_data=data))
-                    s.is_valid(raise_exception=True)
-                    inst = s.save()
-                    for repeater in self.repeaters:
-                        for index, post_data in enumerate(repeater_data[repeater]):
-                            post_data = self.get_post_data(post_data=post_data, serializer_class=self.repeaters[repeater])
-                            post_data[self.repeater_instance_key] = inst.pk
-                            s = self.repeaters[repeater](data=post_data)
-                            if s.is_valid():
-                                s.save()
-                            else:
-                                form_errors.update({f'{repeater}.{index}.{k}': v for k, v in s.errors.items()})
-                    if form_errors:
-                        raise ValidationError(form_errors)
-                    return Response({'success': s.data}, status=status.HTTP_201_CREATED)
-            except:
-                transaction.rollback()
-                raise
+            with transaction.atomic():
+                form_errors = dict()
+                data = self.request.data.copy()
+                repeater_data = dict()
+                for repeater in self.repeaters:
+                    repeater_data[repeater] = data.pop(repeater, [])
+                    # As bulk_update does, malformed rows are reported before any of them is read
+                    if not isinstance(repeater_data[repeater], list):
+                        form_errors[repeater] = ['Expected a list']
+                        continue
+                    form_errors.update({f'{repeater}.{index}': ['Expected an object']
+                                        for index, row in enumerate(repeater_data[repeater])
+                                        if not isinstance(row, dict)})
+                if form_errors:
+                    raise ValidationError(form_errors)
+                s = self.get_serializer(data=self.get_post_data(post_data=data))
+                s.is_valid(raise_exception=True)
+                inst = s.save()
+                valid_serializers = dict()
+                for repeater in self.repeaters:
+                    serializer_class = self.repeaters[repeater]
+                    rows = self.get_rows_post_data(repeater_data[repeater], serializer_class=serializer_class)
+                    for post_data in rows:
+                        post_data[self.repeater_instance_key] = inst.pk
+                    batch = DjangoBatchSerializerValidator(model=serializer_class.Meta.model, rows=rows)
+                    valid_serializers[repeater] = []
+                    for index, post_data in enumerate(rows):
+                        context = {**self.get_serializer_context(), 'batch': batch, 'batch_index': index,
+                                   'related_instances': {(inst.__class__, inst.pk): inst}}
+                        child = serializer_class(data=post_data, context=context)
+                        if child.is_valid():
+                            valid_serializers[repeater].append(child)
+                        else:
+                            form_errors.update({f'{repeater}.{index}.{k}': v for k, v in child.errors.items()})
+                if form_errors:
+                    raise ValidationError(form_errors)
+                for repeater, serializers in valid_serializers.items():
+                    if self.repeater_bulk_create:
+                        self.bulk_create_repeater(self.repeaters[repeater], serializers)
+                    else:
+                        for child in serializers:
+                            child.save()
+                return Response({'success': self.get_list_serializer(inst).data}, status=status.HTTP_201_CREATED)
         return self.create_or_update()
 
+    def import_file(self):
+        """
+        action: import, multipart 'file' of CSV/NDJSON rows (file_format: csv/ndjson, by default the file extension)
+        validated by the create serializer and bulk created chunk by chunk, invalid rows are reported per row number.
+        The report keeps the first import_error_limit invalid rows, error_count counts all of them
+        (the import_rows command writes a full report with --errors).
+        """
+        upload = self.request.FILES.get('file', None)
+        if upload is None:
+            raise ValidationError({'file': ['This field is required.']})
+        import_format = self.request.GET.get('file_format', None) or get_import_format(upload.name)
+        errors = []
+
+        def on_error(number, row_errors):
+            if len(errors) < self.import_error_limit:
+                errors.append({'row': number, 'errors': row_errors})
+
+        with io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='') as stream:
+            result = import_rows(self.get_serializer_class(), read_rows(stream, import_format),
+                                 chunk_size=self.import_chunk_size, context=self.get_serializer_context(),
+                                 on_error=on_error)
+        return Response({'success': {'rows': result['row'], 'created': result['created'], 'errors': errors,
+                                     'error_count': result['errors']}}, status=status.HTTP_200_OK)
+
+    def bulk_create_repeater(self, serializer_class, serializers):
+        """
+        Persists validated repeater rows with bulk_create in repeater_batch_size INSERTs, MyQuerySet adds the salts.
+        Serializer create() is bypassed, so repeaters writing M2M fields should keep repeater_bulk_create off.
+        """
+        model = serializer_class.Meta.model
+        objs = [model(**{**s.validated_data, **s.sv.enc_attrs}) for s in serializers]
+        objs = model.objects.bulk_create(objs, batch_size=self.repeater_batch_size)
+        self.model_changed(model)
+        return objs
+
     def put(self, request, *args, **kwargs):
+        if isinstance(request.data, list):
+            return self.bulk_update(request.data)
         return self.create_or_update(instance=self.get_object())
 
+    def bulk_update(self, rows):
+        """
+        PUT of a list of rows, each carrying its rec_id.
+        Rows are validated through the update serializer with set based uniqueness and FK lookups,
+        then written with one bulk_update over the fields present in the payload, all or nothing.
+        """
+        invalid = {str(index): ['Expected an object'] for index, row in enumerate(rows) if not isinstance(row, dict)}
+        if invalid:
+            raise ValidationError(invalid)
+        serializer_class = self.get_serializer_class()
+        pks = rec_id_codec.decode_many([row.get('rec_id', None) for row in rows])
+        # Rows after the first of a rec_id would be validated against the same instance and silently win
+        first_index = dict()
+        duplicates = {f'{index}.rec_id': ['Duplicate rec_id'] for index, pk in enumerate(pks)
+                      if pk is not None and first_index.setdefault(pk, index) != index}
+        if duplicates:
+            raise ValidationError(duplicates)
+        instances = self.get_queryset().in_bulk([pk for pk in pks if pk is not None])
+        rows = self.get_rows_post_data(rows, serializer_class=serializer_class)
+        batch = DjangoBatchSerializerValidator(model=self.model, rows=rows, instances=[instances.get(pk) for pk in pks])
+        context = {**self.get_serializer_context(), 'batch': batch,
+                   'related_instances': self.get_related_instances(serializer_class, rows)}
+        form_errors = dict()
+        serializers = []
+        for index, (pk, post_data) in enumerate(zip(pks, rows)):
+            if pk not in instances:
+                form_errors[f'{index}.rec_id'] = ['Record not found']
+                continue
+            s = serializer_class(instance=instances[pk], data=post_data, context={**context, 'batch_index': index})
+            if s.is_valid():
+                serializers.append(s)
+            else:
+                form_errors.update({f'{index}.{k}': v for k, v in s.errors.items()})
+        if form_errors:
+            raise ValidationError(form_errors)
+        fields = set()
+        for s in serializers:
+            for k, v in {**s.validated_data, **s.sv.enc_attrs}.items():
+                setattr(s.instance, k, v)
+                fields.add(k)
+        with transaction.atomic():
+            if fields:
+                # MyQuerySet.update bumps the ModelVersion
+                self.model.objects.bulk_update([s.instance for s in serializers], list(fields),
+                                               batch_size=self.repeater_batch_size)
+        queryset = self.get_list_queryset().filter(pk__in=[s.instance.pk for s in serializers])
+        return Response({'success': self.get_list_serializer(queryset, many=True).data}, status=status.HTTP_200_OK)
+
     def create_or_update(self, instance=None):
         s = self.get_serializer(data=self.get_post_data(), instance=instance)
         s.is_valid(raise_exception=True)
@@ -114,7 +528,128 @@ class GenericAPICRUDView(GenericAPIView):
         return Response({'success': self.get_list_serializer(inst).data}, status=status_code)
 
     def delete(self, request, *args, **kwargs):
-        self.get_object().delete()
+        """
+        Soft delete, is_del=True. A list of rec_ids (body or comma separated query) is flagged with one UPDATE.
+        Live rows of soft deletable models with a CASCADE FK to the deleted records are flagged with them,
+        see MyQuerySet.soft_delete.
+        """
+        rec_ids = self.get_bulk_rec_ids()
+        if rec_ids is not None:
+            pks = [pk for pk in rec_id_codec.decode_many(rec_ids) if pk is not None]
+            count = self.get_queryset().filter(pk__in=pks).soft_delete()
+            return Response({'success': 'Deleted', 'count': count}, status=status.HTTP_200_OK)
+        instance = self.get_object()
+        self.get_queryset().filter(pk=instance.pk).soft_delete()
+        return Response({'success': 'Deleted'}, status=status.HTTP_200_OK)
+
+
+class AsyncGenericAPICRUDView(GenericAPICRUDView):
+    """
+    ASGI native counterpart of GenericAPICRUDView, requests wait on the database without holding a thread.
+    get_data/fetch_record and single create/update run on the async ORM, check_exists runs as
+    acheck_exists after validate() and FK targets are resolved up front with ain_bulk.
+    Repeater posts, imports, bulk updates, paginated listings and the cascading soft delete of delete run the
+    sync implementation in a thread.
+    Serializers create() is bypassed on save, so M2M fields need the sync view.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def options(self, request, *args, **kwargs):
+        return super().options(request, *args, **kwargs)
+
+    async def aget_related_instances(self, serializer_class, rows):
+        related_instances = dict()
+        for queryset, pks in self.get_related_pks(serializer_class, rows):
+            for pk, inst in (await queryset.ain_bulk(pks)).items():
+                related_instances[(queryset.model, pk)] = inst
+        return related_instances
+
+    async def get(self, request, *args, **kwargs):
+        action = request.GET.get('action', None)
+        if action == 'export':
+            return await sync_to_async(self.export_file)()
+        headers = dict()
+        if self.conditional_get and action in ('get_data', 'fetch_record'):
+            headers = self.get_conditional_headers(await ModelVersion.aget_versions(self.get_read_models()))
+            not_modified = self.get_not_modified_response(headers)
+            if not_modified is not None:
+                return not_modified
+        if action == 'get_data' and self.get_page_size():
+            response = await sync_to_async(self.get_response_data)(action)
+            return Response(response, status=status.HTTP_200_OK, headers=headers)
+        response = {'data': None}
+        if action == 'get_data':
+            values_plan = self.get_values_plan()
+            if values_plan is None:
+                rows = [row async for row in self.get_list_queryset()]
+                response['data'] = self.get_list_serializer(rows, many=True).data
+            else:
+                response['data'] = [row async for row in aiter_values_representation(self.get_queryset(), values_plan)]
+        if action == 'fetch_record':
+            instance = await self.get_list_queryset().aget(**self.get_object_lookup_kwargs())
+            response['data'] = self.get_list_serializer(instance).data
+        if request.GET.get('get_form_configs', False) == 'True':
+            response['form_configs'] = await sync_to_async(self.get_form_configs)()
+        return Response(response, status=status.HTTP_200_OK, headers=headers)
+
+    async def post(self, request, *args, **kwargs):
+        if request.GET.get('action', None) == 'import':
+            return await sync_to_async(self.import_file)()
+        if hasattr(self, 'repeaters') and hasattr(self, 'repeater_instance_key'):
+            return await sync_to_async(super().post)(request, *args, **kwargs)
+        return await self.acreate_or_update()
+
+    async def put(self, request, *args, **kwargs):
+        if isinstance(request.data, list):
+            return await sync_to_async(self.bulk_update)(request.data)
+        instance = await self.get_queryset().aget(**self.get_object_lookup_kwargs())
+        return await self.acreate_or_update(instance=instance)
+
+    async def acreate_or_update(self, instance=None):
+        serializer_class = self.get_serializer_class()
+        post_data = self.get_post_data()
+        context = {**self.get_serializer_context(), 'defer_exists': True, 'related_instances_complete': True,
+                   'related_instances': await self.aget_related_instances(serializer_class, [post_data])}
+        s = self.get_serializer(data=post_data, instance=instance, context=context)
+        s.is_valid(raise_exception=True)
+        await s.sv.acheck_exists(*s.sv.deferred_exists)
+        if s.sv.custom_errors:
+            raise ValidationError(s.sv.custom_errors)
+        inst = instance or self.model()
+        for k, v in {**s.validated_data, **s.sv.enc_attrs}.items():
+            setattr(inst, k, v)
+        await inst.asave()
+        inst = await self.get_list_queryset().aget(pk=inst.pk)
+        status_code = status.HTTP_200_OK if instance else status.HTTP_201_CREATED
+        return Response({'success': self.get_list_serializer(inst).data}, status=status_code)
+
+    async def delete(self, request, *args, **kwargs):
+        rec_ids = self.get_bulk_rec_ids()
+        if rec_ids is not None:
+            pks = [pk for pk in rec_id_codec.decode_many(rec_ids) if pk is not None]
+            count = await sync_to_async(self.get_queryset().filter(pk__in=pks).soft_delete)()
+            return Response({'success': 'Deleted', 'count': count}, status=status.HTTP_200_OK)
+        instance = await self.get_queryset().aget(**self.get_object_lookup_kwargs())
+        await sync_to_async(self.get_queryset().filter(pk=instance.pk).soft_delete)()
         return Response({'success': 'Deleted'}, status=status.HTTP_200_OK)
 
 
@@ -122,18 +657,42 @@ class EmployeeView(GenericAPICRUDView):
     model = Employee
     serializer_class = EmployeeCreateUpdateSerializer
     list_serializer_class = EmployeeListRetrieveSerializer
+    response_cache = response_cache
+    values_fast_path = True
 
 
 class DepartmentView(GenericAPICRUDView):
     model = Department
     serializer_class = DepartmentCreateUpdateSerializer
     list_serializer_class = DepartmentListRetrieveSerializer
+    response_cache = response_cache
     repeater_instance_key = 'department'
+    repeater_bulk_create = True
     repeaters = {
         'employees': EmployeeCreateUpdateSerializer,
     }
 
-    def get_queryset(self):
-        return self.model.objects.prefetch_related('employees').all()
 
+class AsyncEmployeeView(AsyncGenericAPICRUDView):
+    model = Employee
+    serializer_class = EmployeeCreateUpdateSerializer
+    list_serializer_class = EmployeeListRetrieveSerializer
+    values_fast_path = True
 
+
+class AsyncDepartmentView(AsyncGenericAPICRUDView):
+    model = Department
+    serializer_class = DepartmentCreateUpdateSerializer
+    list_serializer_class = DepartmentListRetrieveSerializer
+    repeater_instance_key = 'department'
+    repeater_bulk_create = True
+    repeaters = {
+        'employees': EmployeeCreateUpdateSerializer,
+    }
+
+
+class MetricsView(APIView):
+    """Aggregated MetricsMiddleware counters and latency percentiles (ms) of the CRUD views"""
+
+    def get(self, request, *args, **kwargs):
+        return Response({'data': metrics_registry.snapshot()}, status=status.HTTP_200_OK)
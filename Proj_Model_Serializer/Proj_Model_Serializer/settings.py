@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'App_Model_Serializer.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,6 +72,38 @@ TEMPLATES = [
 
 REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'App_Model_Serializer.utils.custom_exception_handler',
+    'DEFAULT_RENDERER_CLASSES': [
+        'App_Model_Serializer.renderers.CRUDJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Public rec_id scheme of the CRUD views, CODEC is a RecIdCodec subclass, the other keys its arguments
+REC_ID = {
+    'CODEC': 'App_Model_Serializer.rec_id.RecIdCodec',
+    'OFFSET': 10000,
+}
+
+# GET response cache of the CRUD views, ALIAS None keeps it in process, otherwise a CACHES alias
+RESPONSE_CACHE = {
+    'ALIAS': None,
+    'TIMEOUT': 300,
+    'MAX_ENTRIES': 1000,
+}
+
+# Unhandled API errors, written by a background thread of App_Model_Serializer.utils.ErrorLogWriter
+ERROR_LOG = {
+    'PATH': BASE_DIR / 'error_log.txt',
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'BACKUP_COUNT': 5,
+    'QUEUE_SIZE': 10000,
+    'DEDUPE_WINDOW': 60,
+}
+
+# Per request query/DB/serializer metrics of the CRUD views, Server-Timing header and metrics/ endpoint
+METRICS = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
 }
 
 WSGI_APPLICATION = 'Proj_Model_Serializer.wsgi.application'